@@ -0,0 +1,214 @@
+"""
+Benchmark for the response encoding.
+
+Measures the functions and responses producing the bytes sent to the clients,
+with bodies from 100 B to 50 MB, text (``text/gemini``) and binary
+(``application/octet-stream``) ones.
+
+Each measure is the best of several runs, each run lasting at least 0.2s. The
+results are compared to the saved baseline, if any, and can be saved as the new
+baseline. Baselines only make sense on the machine where they were measured.
+
+Usage: python benchmarks/bench_encoding.py [--save] [--baseline FILE] [--filter TEXT]
+"""
+import json
+import os
+import tempfile
+import timeit
+from argparse import ArgumentParser
+from os.path import dirname, exists, join
+
+from gemeaux import (
+    DirectoryListingResponse,
+    DocumentResponse,
+    SuccessResponse,
+    TemplateResponse,
+    TextResponse,
+    crlf,
+)
+
+SIZES = (100, 10 * 1024, 1024 * 1024, 10 * 1024 * 1024, 50 * 1024 * 1024)
+# Directory listings are built from the entries of a directory on disk
+MAX_LISTING_SIZE = 1024 * 1024
+REPEAT = 5
+DEFAULT_BASELINE = join(dirname(__file__), "bench_encoding.json")
+
+TEXT_LINE = "=> gemini://localhost/gemlog/post.gmi A link, in a Gemini document\n"
+BINARY_BLOCK = bytes(range(256))
+
+
+def make_text(size):
+    return (TEXT_LINE * (size // len(TEXT_LINE) + 1))[:size]
+
+
+def make_binary(size):
+    return (BINARY_BLOCK * (size // len(BINARY_BLOCK) + 1))[:size]
+
+
+def human_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size:g}{unit}"
+        size /= 1024
+
+
+class BodyResponse(SuccessResponse):
+    """
+    Response with a fixed body, to measure ``Response.__bytes__`` alone.
+    """
+
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+
+    def __body__(self):
+        return self.body
+
+
+def consume(response):
+    """
+    Send the response to nowhere, like the serving loop does.
+    """
+    for _ in response.stream():
+        pass
+
+
+def get_cases(directory):
+    """
+    Return the ``(name, kind, size, function)`` benchmark cases.
+    """
+    cases = []
+    template_file = join(directory, "template.gmi")
+    with open(template_file, "w") as fd:
+        fd.write("# $title\n\n$body\n")
+    for size in SIZES:
+        text = make_text(size)
+        data = {"text": text.encode(), "binary": make_binary(size)}
+        mimetypes = {"text": "text/gemini", "binary": "application/octet-stream"}
+        extensions = {"text": "gmi", "binary": "bin"}
+        for kind in ("text", "binary"):
+            body, mimetype = data[kind], mimetypes[kind]
+            cases.append(("crlf", kind, size, lambda body=body: crlf(body)))
+            cases.append(
+                (
+                    "Response.__bytes__",
+                    kind,
+                    size,
+                    lambda body=body, mimetype=mimetype: bytes(
+                        BodyResponse(body, mimetype)
+                    ),
+                )
+            )
+            path = join(directory, f"document-{size}.{extensions[kind]}")
+            with open(path, "wb") as fd:
+                fd.write(body)
+            cases.append(
+                (
+                    "DocumentResponse",
+                    kind,
+                    size,
+                    lambda path=path: consume(DocumentResponse(path, directory)),
+                )
+            )
+        cases.append(
+            (
+                "TextResponse",
+                "text",
+                size,
+                lambda text=text: bytes(TextResponse(body=text)),
+            )
+        )
+        cases.append(
+            (
+                "TemplateResponse.__body__",
+                "text",
+                size,
+                lambda text=text: TemplateResponse(
+                    template_file, title="Benchmark", body=text
+                ).__body__(),
+            )
+        )
+        if size <= MAX_LISTING_SIZE:
+            listing_dir = make_listing(directory, size)
+            cases.append(
+                (
+                    "DirectoryListingResponse",
+                    "text",
+                    size,
+                    lambda listing_dir=listing_dir: bytes(
+                        DirectoryListingResponse(listing_dir, directory)
+                    ),
+                )
+            )
+    return cases
+
+
+def make_listing(directory, size):
+    """
+    Create a directory whose listing is about ``size`` bytes long.
+    """
+    listing_dir = join(directory, f"listing-{size}")
+    os.mkdir(listing_dir)
+    # All the entries have the same length
+    line_size = len(f"=> /listing-{size}/entry-000000.gmi\r\n")
+    for index in range(max(1, size // line_size)):
+        open(join(listing_dir, f"entry-{index:06}.gmi"), "w").close()
+    return listing_dir
+
+
+def measure(function):
+    """
+    Return the best duration of a call, in seconds.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def main():
+    parser = ArgumentParser("Gemeaux encoding benchmark")
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE, help="Baseline results file"
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="Save the results as the baseline"
+    )
+    parser.add_argument("--filter", help="Only run the cases whose name contains it")
+    options = parser.parse_args()
+
+    baseline = {}
+    if exists(options.baseline):
+        with open(options.baseline) as fd:
+            baseline = json.load(fd)
+
+    results = {}
+    print(
+        f"{'case':<26} {'kind':<7} {'size':>6} {'time (ms)':>11} {'MB/s':>9} {'baseline':>9}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for name, kind, size, function in get_cases(directory):
+            if options.filter and options.filter not in name:
+                continue
+            duration = measure(function)
+            key = f"{name} {kind} {size}"
+            results[key] = duration
+            comparison = ""
+            if key in baseline:
+                change = (duration / baseline[key] - 1) * 100
+                comparison = f"{change:+.1f}%"
+            throughput = size / duration / 1024 / 1024
+            print(
+                f"{name:<26} {kind:<7} {human_size(size):>6} "
+                f"{duration * 1e3:>11.4f} {throughput:>9.1f} {comparison:>9}"
+            )
+
+    if options.save:
+        # The cases that weren't run keep their previous baseline
+        baseline.update(results)
+        with open(options.baseline, "w") as fd:
+            json.dump(baseline, fd, indent=2, sort_keys=True)
+        print(f"Baseline saved to {options.baseline}")
+
+
+if __name__ == "__main__":
+    main()
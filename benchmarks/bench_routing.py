@@ -0,0 +1,37 @@
+"""
+Benchmark for the url routing.
+
+Lookup time should stay flat, whatever the number of routes.
+
+Usage: python benchmarks/bench_routing.py
+"""
+import timeit
+
+from gemeaux import App, TextResponse, ZeroConfig
+
+ROUTE_COUNTS = (10, 100, 1000, 10000, 100000)
+LOOKUPS = 100000
+
+
+def main():
+    response = TextResponse(body="bench")
+    print(f"{'routes':>8} {'lookup (µs)':>12}")
+    for count in ROUTE_COUNTS:
+        urls = {f"/~user{i}": response for i in range(count)}
+        urls[""] = response
+        app = App(urls, config=ZeroConfig())
+        paths = [
+            f"/~user{count // 2}/gemlog/index.gmi",  # Deep match
+            f"/~user{count - 1}",  # Exact match
+            "/not/a/user/route",  # Catch-all
+        ]
+        durations = [
+            min(timeit.repeat(lambda: app.get_route(path), number=LOOKUPS, repeat=3))
+            for path in paths
+        ]
+        average = sum(durations) / len(durations) / LOOKUPS
+        print(f"{count:>8} {average * 1e6:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark for the template engines.
+
+Compares the ``string.Template`` substitution (with a listing pre-joined in the
+context) to the compiled template engine (with a loop in the template).
+
+Each measure is the best of several runs, each run lasting at least 0.2s.
+
+Usage: python benchmarks/bench_templates.py
+"""
+import tempfile
+import timeit
+from os.path import join
+
+from gemeaux import CompiledTemplateResponse, TemplateResponse
+
+ITEM_COUNTS = (10, 100, 1000, 10000)
+REPEAT = 5
+
+SUBSTITUTE_TEMPLATE = """# $title
+
+$listing
+"""
+COMPILED_TEMPLATE = """# {{ title }}
+
+{% for post in posts %}
+=> {{ post.url }} {{ post.date }} - {{ post.title }}
+{% endfor %}
+"""
+
+
+def substitute(template_file, posts):
+    # The listing has to be built when computing the context
+    listing = "\n".join(
+        f"=> {post['url']} {post['date']} - {post['title']}" for post in posts
+    )
+    return bytes(TemplateResponse(template_file, title="Gemlog", listing=listing))
+
+
+def compiled(template_file, posts):
+    return bytes(CompiledTemplateResponse(template_file, title="Gemlog", posts=posts))
+
+
+def measure(function):
+    """
+    Return the best duration of a call, in seconds.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        substitute_file = join(directory, "substitute.gmi")
+        with open(substitute_file, "w") as fd:
+            fd.write(SUBSTITUTE_TEMPLATE)
+        compiled_file = join(directory, "compiled.gmi")
+        with open(compiled_file, "w") as fd:
+            fd.write(COMPILED_TEMPLATE)
+
+        print(f"{'items':>6} {'substitute (ms)':>16} {'compiled (ms)':>14}")
+        for count in ITEM_COUNTS:
+            posts = [
+                {
+                    "url": f"/gemlog/post-{i}.gmi",
+                    "date": "2020-12-01",
+                    "title": f"Post number {i}",
+                }
+                for i in range(count)
+            ]
+            # Both engines should produce the same document
+            assert substitute(substitute_file, posts) == compiled(compiled_file, posts)
+            results = []
+            for function, template_file in (
+                (substitute, substitute_file),
+                (compiled, compiled_file),
+            ):
+                duration = measure(lambda: function(template_file, posts))
+                results.append(duration * 1e3)
+            print(f"{count:>6} {results[0]:>16.3f} {results[1]:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,7 @@ class HelloWorldHandler(Handler):
     def get_response(self):
         return TextResponse("Title", "Hello World!")
 
-    def handle(self, url, path):
+    def handle(self, url, path, request=None):
         response = self.get_response()
         return response
 
@@ -1,10 +1,18 @@
-import collections
+import asyncio
+import collections.abc
+import os
+import selectors
+import signal
 import ssl
 import sys
 import time
 from argparse import ArgumentParser
-from socket import AF_INET, SOCK_STREAM, socket
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from socket import AF_INET, SOCK_STREAM, SOL_SOCKET, socket
 from ssl import PROTOCOL_TLS_SERVER, SSLContext
+from threading import BoundedSemaphore, Lock
 from urllib.parse import urlparse
 
 from .exceptions import (
@@ -14,12 +22,25 @@ from .exceptions import (
     TemplateError,
     TimeoutException,
 )
-from .handlers import Handler, StaticHandler, TemplateHandler
+from .handlers import (
+    Handler,
+    MetricsHandler,
+    StaticHandler,
+    TemplateHandler,
+    takes_request,
+)
+from .limits import RateLimiter
+from .logs import AccessLog
+from .metrics import METRICS, Metrics, Timing
+from .requests import MAX_REQUEST_SIZE, Request
 from .responses import (
     BadRequestResponse,
+    CompiledTemplateResponse,
     DirectoryListingResponse,
     DocumentResponse,
+    EncodedResponse,
     InputResponse,
+    MetricsResponse,
     NotFoundResponse,
     PermanentFailureResponse,
     PermanentRedirectResponse,
@@ -27,11 +48,18 @@ from .responses import (
     RedirectResponse,
     Response,
     SensitiveInputResponse,
+    SlowDownResponse,
     SuccessResponse,
     TemplateResponse,
     TextResponse,
     crlf,
 )
+from .routes import PrefixTrie
+
+try:
+    from socket import SO_REUSEPORT
+except ImportError:  # Not available on every platform
+    SO_REUSEPORT = None
 
 __version__ = "0.0.3.dev0"
 
@@ -42,6 +70,27 @@ class ZeroConfig:
     certfile = "cert.pem"
     keyfile = "key.pem"
     nb_connections = 5
+    engine = "sync"
+    workers = 10
+    processes = 1
+    handshake_timeout = 5
+    request_timeout = 5
+    session_tickets = True
+    ecdh_curve = None
+    ciphers = None
+    log_file = None
+    log_max_bytes = 0
+    log_backups = 5
+    log_sample_rate = 1
+    log_max_pending = 10000
+    timings = False
+    log_timings = False
+    max_in_flight = 0
+    max_queue_delay = 0
+    slow_down_delay = 1
+    client_rate = 0
+    client_burst = 10
+    client_max_connections = 0
 
 
 class ArgsConfig:
@@ -64,6 +113,127 @@ class ArgsConfig:
             type=int,
             help="Maximum number of connections — default: 5",
         )
+        parser.add_argument(
+            "--engine",
+            default="sync",
+            choices=App.ENGINES,
+            help="Serving engine — default: sync.",
+        )
+        parser.add_argument(
+            "--workers",
+            default=10,
+            type=int,
+            help="Number of worker threads for the `threads` engine — default: 10",
+        )
+        parser.add_argument(
+            "--processes",
+            default=1,
+            type=int,
+            help="Number of worker processes — default: 1",
+        )
+        parser.add_argument(
+            "--handshake-timeout",
+            default=5,
+            type=float,
+            help="Maximum duration of the TLS handshake, in seconds — default: 5",
+        )
+        parser.add_argument(
+            "--request-timeout",
+            default=5,
+            type=float,
+            help="Maximum duration of the request reading, in seconds — default: 5",
+        )
+        parser.add_argument(
+            "--no-session-tickets",
+            dest="session_tickets",
+            action="store_false",
+            help="Disable TLS session tickets.",
+        )
+        parser.add_argument(
+            "--ecdh-curve",
+            default=None,
+            help="Name of the curve used for ECDH key exchanges, e.g. `prime256v1`.",
+        )
+        parser.add_argument(
+            "--ciphers",
+            default=None,
+            help="Available ciphers, in the server's order of preference (OpenSSL cipher list format).",
+        )
+        parser.add_argument(
+            "--log-file",
+            default=None,
+            help="Write the logs to this file instead of the standard output.",
+        )
+        parser.add_argument(
+            "--log-max-bytes",
+            default=0,
+            type=int,
+            help="Rotate the log file when it exceeds this size (0: never) — default: 0",
+        )
+        parser.add_argument(
+            "--log-backups",
+            default=5,
+            type=int,
+            help="Number of rotated log files to keep — default: 5",
+        )
+        parser.add_argument(
+            "--log-sample-rate",
+            default=1,
+            type=float,
+            help="Ratio of the requests to log, between 0 and 1 — default: 1",
+        )
+        parser.add_argument(
+            "--timings",
+            action="store_true",
+            help="Measure the duration of each phase of the requests, reported in the metrics.",
+        )
+        parser.add_argument(
+            "--log-timings",
+            action="store_true",
+            help="Measure the duration of each phase of the requests, and log them.",
+        )
+        parser.add_argument(
+            "--log-max-pending",
+            default=10000,
+            type=int,
+            help="Log lines waiting to be written, beyond which they're dropped — default: 10000",
+        )
+        parser.add_argument(
+            "--max-in-flight",
+            default=0,
+            type=int,
+            help="Connections served or waiting for a worker, beyond which they're answered with 44 SLOW DOWN (0: no limit) — default: 0",
+        )
+        parser.add_argument(
+            "--max-queue-delay",
+            default=0,
+            type=float,
+            help="Time waiting for a worker, in seconds, beyond which connections are answered with 44 SLOW DOWN (0: no limit) — default: 0",
+        )
+        parser.add_argument(
+            "--slow-down-delay",
+            default=1,
+            type=int,
+            help="Delay sent with the 44 SLOW DOWN responses, in seconds — default: 1",
+        )
+        parser.add_argument(
+            "--client-rate",
+            default=0,
+            type=float,
+            help="Connections per second allowed to each client IP, over a burst (0: no limit) — default: 0",
+        )
+        parser.add_argument(
+            "--client-burst",
+            default=10,
+            type=int,
+            help="Connections a client IP may open at once before being rate limited — default: 10",
+        )
+        parser.add_argument(
+            "--client-max-connections",
+            default=0,
+            type=int,
+            help="Open connections allowed to each client IP (0: no limit) — default: 0",
+        )
         parser.add_argument(
             "--version",
             help="Return version and exits",
@@ -81,6 +251,27 @@ class ArgsConfig:
         self.certfile = args.certfile
         self.keyfile = args.keyfile
         self.nb_connections = args.nb_connections
+        self.engine = args.engine
+        self.workers = args.workers
+        self.processes = args.processes
+        self.handshake_timeout = args.handshake_timeout
+        self.request_timeout = args.request_timeout
+        self.session_tickets = args.session_tickets
+        self.ecdh_curve = args.ecdh_curve
+        self.ciphers = args.ciphers
+        self.log_file = args.log_file
+        self.log_max_bytes = args.log_max_bytes
+        self.log_backups = args.log_backups
+        self.log_sample_rate = args.log_sample_rate
+        self.log_max_pending = args.log_max_pending
+        self.timings = args.timings
+        self.log_timings = args.log_timings
+        self.max_in_flight = args.max_in_flight
+        self.max_queue_delay = args.max_queue_delay
+        self.slow_down_delay = args.slow_down_delay
+        self.client_rate = args.client_rate
+        self.client_burst = args.client_burst
+        self.client_max_connections = args.client_max_connections
 
 
 def get_path(url):
@@ -99,42 +290,67 @@ def check_url(url, server_port):
 
     Raise exception or return None
     """
-    parsed = urlparse(url, "gemini")
-
-    # Check for bad request
-    # Note: the URL will be cleaned before being used
-    if not url.endswith("\r\n"):
-        # TimeoutException will cause no response
-        raise TimeoutException((url, parsed))
-    # Other than Gemini will trigger a PROXY ERROR
-    if parsed.scheme != "gemini":
-        raise ProxyRequestRefusedException
-    # You need to provide the right scheme
-    if not url.startswith("gemini://"):
-        # BadRequestException will return BadRequestResponse
-        raise BadRequestException
-    # URL max length is 1024.
-    if len(url.strip()) > 1024:
-        # BadRequestException will return BadRequestResponse
-        raise BadRequestException
-    # Not the right port
-    if ":" in parsed.netloc:
-        location, port = parsed.netloc.split(":")
-        if int(port) != server_port:
-            raise ProxyRequestRefusedException
+    Request.parse(url, server_port)
     return True
 
 
+# Pre-encoded error responses, for the errors with a fixed reason.
+# These instances are shared by all requests.
+ERROR_RESPONSES = {
+    "OS Error": PermanentFailureResponse("OS Error"),
+    "SSL Error": PermanentFailureResponse("SSL Error"),
+    "Unicode Decode Error": BadRequestResponse("Unicode Decode Error"),
+    "Bad Request": BadRequestResponse(),
+    "Proxy Request Refused": ProxyRequestRefusedResponse(),
+}
+# Pre-encoded NotFoundResponses, for the most frequent reasons
+NOT_FOUND_RESPONSES = {
+    reason: NotFoundResponse(reason)
+    for reason in (None, "Route Not Found", "Path not found", "Forbidden path")
+}
+for error_response in chain(ERROR_RESPONSES.values(), NOT_FOUND_RESPONSES.values()):
+    # The encoded response is cached by the instance.
+    bytes(error_response)
+
+
+class PendingHandshake:
+    """
+    Connection of the ``sync`` engine, waiting for its TLS handshake to complete.
+    """
+
+    __slots__ = ("address", "accepted", "deadline", "delay", "timing")
+
+    def __init__(self, address, accepted, deadline, delay, timing):
+        self.address = address
+        self.accepted = accepted
+        self.deadline = deadline
+        self.delay = delay
+        self.timing = timing
+
+
 class App:
 
+    ENGINES = ("sync", "asyncio", "threads")
+    # Threads answering the connections rejected by the admission control, and
+    # the number of rejected connections waiting for them, beyond which they're
+    # closed without a response.
+    REJECTION_WORKERS = 2
+    MAX_PENDING_REJECTIONS = 64
+    # Time to receive the request of a rejected connection, in seconds
+    REJECTION_TIMEOUT = 0.5
+    # Handshakes performed at the same time by the sync engine, beyond which the
+    # new connections are closed.
+    MAX_PENDING_HANDSHAKES = 64
+    # Delay (in seconds) before restarting a dead worker process
+    RESTART_DELAY = 1
     TIMESTAMP_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
     BANNER = f"""
 ♊ Welcome to your Gémeaux server (v{__version__}) ♊
 """
 
-    def __init__(self, urls, config=None):
+    def __init__(self, urls, config=None, metrics=None):
         # Check the urls
-        if not isinstance(urls, collections.Mapping):
+        if not isinstance(urls, collections.abc.Mapping):
             # Not of the dict type
             raise ImproperlyConfigured("Bad url configuration: not a dict or dict-like")
 
@@ -148,53 +364,145 @@ class App:
                 raise ImproperlyConfigured(msg)
 
         self.urls = urls
+        # Responses mounted in the url map are encoded once and for all.
+        for k_value in urls.values():
+            if not isinstance(k_value, Response):
+                continue
+            # Big documents are streamed, not encoded.
+            if getattr(k_value, "streaming", False):
+                continue
+            try:
+                bytes(k_value)
+            except Exception:
+                # The error will be handled when the response is requested.
+                pass
+        # Urls of the handlers whose ``handle()`` method doesn't take the
+        # ``request`` argument (written for older versions).
+        self.legacy_handlers = {
+            k_url
+            for k_url, k_value in urls.items()
+            if isinstance(k_value, Handler) and not takes_request(k_value.handle)
+        }
+        # Compiled url map. The catch-all is handled separately.
+        self.routes = PrefixTrie(k_url for k_url in urls if k_url)
         self.config = config or ArgsConfig()
+        self.context = None
+        # Number of TLS handshakes that failed or timed out
+        self.aborted_handshakes = 0
+        # Requests not received completely, or too long
+        self.dropped_requests = 0
+        # Connections answered with 44 SLOW DOWN, or closed, by the admission control
+        # or by the rate limiter
+        self.rejected_requests = 0
+        self.rate_limited_requests = 0
+        # Connections being served by the asyncio engine
+        self.in_flight = 0
+        # Successful handshakes, resuming a previous TLS session or not
+        self.full_handshakes = 0
+        self.resumed_handshakes = 0
+        self.lock = Lock()
+        # Metrics registry, the process-wide one by default
+        self.metrics = metrics or METRICS
+        # Callables receiving the (request, response, timing) of each request
+        self.timing_hooks = []
+        self.timings = self.config.timings or self.config.log_timings
+        # Pre-encoded 44 SLOW DOWN responses, by delay
+        self.slow_down_response = SlowDownResponse(self.config.slow_down_delay)
+        bytes(self.slow_down_response)
+        self.slow_down_responses = {
+            self.config.slow_down_delay: self.slow_down_response
+        }
+        # Per-client limits
+        self.rate_limiter = None
+        if self.config.client_rate or self.config.client_max_connections:
+            self.rate_limiter = RateLimiter(
+                self.config.client_rate,
+                self.config.client_burst,
+                self.config.client_max_connections,
+            )
+        # Buffered log writer
+        self.access_log = AccessLog(
+            path=self.config.log_file,
+            max_bytes=self.config.log_max_bytes,
+            backup_count=self.config.log_backups,
+            sample_rate=self.config.log_sample_rate,
+            max_pending=self.config.log_max_pending,
+            timestamp_format=self.TIMESTAMP_FORMAT,
+        )
 
     def log(self, message, error=False):
         """
-        Log to standard output
+        Log to standard output (or error), or to the log file.
+
+        Lines are buffered, and written by a background thread.
         """
-        out = sys.stdout
-        if error:
-            out = sys.stderr
-        print(message, file=out)
+        self.access_log.write(message, error)
 
-    def log_access(self, address, url, response=None):
+    def log_access(self, address, url, response=None, size=None, timing=None):
         """
         Log for access to the server
+
+        The ``size`` is the number of bytes sent. If not provided, it's the
+        length of the response. The ``timing`` of the request phases is appended,
+        if given.
         """
+        if not self.access_log.sample():
+            return
         status = mimetype = "??"
         response_size = 0
-        if response:
+        if response is not None:
             error = response.status > 20
             status = response.status
-            response_size = len(response)
+            response_size = len(response) if size is None else size
             mimetype = response.mimetype.split(";")[0]
         else:
             error = True
         message = '{} [{}] "{}" {} {} {}'.format(
             address,
-            time.strftime(self.TIMESTAMP_FORMAT, time.localtime()),
+            self.access_log.timestamp(),
             url.strip(),
             mimetype,
             status,
             response_size,
         )
+        if timing is not None:
+            message = f"{message} {timing}"
         self.log(message, error=error)
 
-    def get_route(self, path):
+    def add_timing_hook(self, hook):
+        """
+        Measure the duration of each phase of the requests, and call
+        ``hook(request, response, timing)`` once each request is served.
 
-        matching = []
+        ``request`` is None if the request couldn't be read, ``timing`` is a
+        ``Timing`` instance.
+        """
+        self.timing_hooks.append(hook)
+        self.timings = True
 
-        for k_url, k_value in self.urls.items():
-            if not k_url:  # Skip the catchall
-                continue
-            if path.startswith(k_url):
-                matching.append(k_url)
+    def record_timing(self, request, response, timing):
+        """
+        Record the phase durations of a request, and call the timing hooks.
+        """
+        self.metrics.record_timing(timing)
+        for hook in self.timing_hooks:
+            try:
+                hook(request, response, timing)
+            except Exception as exc:
+                self.log(f"Exception in timing hook {hook}: {exc}", error=True)
 
-        # One match or more. We'll take the "biggest" match.
-        if len(matching) >= 1:
-            k_url = max(matching, key=len)
+    def get_route(self, path):
+        """
+        Return the ``(url, Handler or Response)`` couple matching the path (or the
+        path of the Request).
+
+        The longest url prefix of the path wins, the catch-all ``""`` url is
+        used when there's no match.
+        """
+        if isinstance(path, Request):
+            path = path.path
+        k_url = self.routes.longest_prefix(path)
+        if k_url is not None:
             return (k_url, self.urls[k_url])
 
         # Catch all
@@ -203,40 +511,68 @@ class App:
 
         raise FileNotFoundError("Route Not Found")
 
-    def exception_handling(self, exception, connection):
+    def get_error_response(self, exception):
         """
-        Handle exceptions and errors when the client is requesting a resource.
+        Return the error response matching the exception, or None.
+
+        Exceptions that don't lead to a response are logged.
         """
+        self.metrics.record_exception(exception)
         response = None
         if isinstance(exception, OSError):
-            response = PermanentFailureResponse("OS Error")
+            response = ERROR_RESPONSES["OS Error"]
         elif isinstance(exception, (ssl.SSLEOFError, ssl.SSLError)):
-            response = PermanentFailureResponse("SSL Error")
+            response = ERROR_RESPONSES["SSL Error"]
         elif isinstance(exception, UnicodeDecodeError):
-            response = BadRequestResponse("Unicode Decode Error")
+            response = ERROR_RESPONSES["Unicode Decode Error"]
         elif isinstance(exception, BadRequestException):
-            response = BadRequestResponse()
+            response = ERROR_RESPONSES["Bad Request"]
         elif isinstance(exception, ProxyRequestRefusedException):
-            response = ProxyRequestRefusedResponse()
+            response = ERROR_RESPONSES["Proxy Request Refused"]
         elif isinstance(exception, ConnectionResetError):
             # No response sent
             self.log("Connection reset by peer...", error=True)
         else:
             self.log(f"Exception: {exception} / {type(exception)}", error=True)
+        return response
+
+    def exception_handling(self, exception, connection):
+        """
+        Handle exceptions and errors when the client is requesting a resource.
 
+        Return the error response, if it has been sent.
+        """
+        response = self.get_error_response(exception)
         try:
             if response and connection:
                 connection.sendall(bytes(response))
+                return response
         except Exception as exc:
             self.log(f"Exception while processing exception… {exc}", error=True)
+        return None
+
+    def get_response(self, request, timing=None):
+        """
+        Return the response to the Request (or to a raw URL).
 
-    def get_response(self, url):
-        path = get_path(url)
+        If a ``timing`` is given, the route and handler phases are measured.
+        """
+        if not isinstance(request, Request):
+            request = Request(request.strip(), path=get_path(request))
         reason = None
         try:
-            k_url, k_value = self.get_route(path)
+            k_url, k_value = self.get_route(request)
+            request.route = k_url
+            if timing is not None:
+                timing.lap("route")
             if isinstance(k_value, Handler):
-                return k_value.handle(k_url, path)
+                if k_url in self.legacy_handlers:
+                    response = k_value.handle(k_url, request.path)
+                else:
+                    response = k_value.handle(k_url, request.path, request)
+                if timing is not None:
+                    timing.lap("handler")
+                return response
             elif isinstance(k_value, Response):
                 return k_value
         except TemplateError as exc:
@@ -248,55 +584,730 @@ class App:
                 reason = exc.args[0]
             self.log(f"Error: {type(exc)} / {reason}", error=True)
 
+        if isinstance(reason, str) or reason is None:
+            response = NOT_FOUND_RESPONSES.get(reason)
+            if response is not None:
+                return response
         return NotFoundResponse(reason)
 
-    def mainloop(self, tls):
-        while True:
-            connection = response = None
-            address = url = ""
-            do_log = False
+    def handshake(self, connection):
+        """
+        Perform the TLS handshake on an accepted connection.
+
+        Return the TLS connection, or None if the handshake failed or didn't
+        complete in time.
+        """
+        connection.settimeout(self.config.handshake_timeout)
+        tls = self.context.wrap_socket(
+            connection, server_side=True, do_handshake_on_connect=False
+        )
+        try:
+            tls.do_handshake()
+        except OSError:
+            # Timeouts and SSL errors
+            self.abort_handshake(tls)
+            return None
+        tls.settimeout(None)
+        self.count_handshake(tls)
+        return tls
+
+    def abort_handshake(self, tls):
+        """
+        Close a TLS connection whose handshake failed or timed out, and count it.
+        """
+        with self.lock:
+            self.aborted_handshakes += 1
+        self.metrics.increment("handshake_failures")
+        tls.close()
+
+    def count_handshake(self, tls):
+        """
+        Count a successful handshake, either resumed or full.
+        """
+        with self.lock:
+            if tls.session_reused:
+                self.resumed_handshakes += 1
+                name = "resumed_handshakes"
+            else:
+                self.full_handshakes += 1
+                name = "full_handshakes"
+        self.metrics.increment(name)
+
+    def drop_request(self, exception):
+        """
+        Count a dropped request, and return the exception to raise.
+        """
+        with self.lock:
+            self.dropped_requests += 1
+        self.metrics.increment("dropped_requests")
+        return exception
+
+    def read_request(self, connection):
+        """
+        Read the request line on a connection, up to its CRLF.
+
+        The request has to be received within ``request_timeout`` seconds, even
+        if it's split into several TLS records. Raise a TimeoutException (no
+        response) if it's not, or a BadRequestException if it's too long.
+        """
+        deadline = time.monotonic() + self.config.request_timeout
+        data = b""
+        while b"\r\n" not in data:
+            if len(data) >= MAX_REQUEST_SIZE:
+                raise self.drop_request(BadRequestException())
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self.drop_request(TimeoutException(data))
+            connection.settimeout(remaining)
             try:
-                connection, (address, _) = tls.accept()
-                url = connection.recv(2048).decode()
+                chunk = connection.recv(MAX_REQUEST_SIZE - len(data))
+            except OSError:
+                # Timeouts and resets
+                chunk = b""
+            if not chunk:
+                raise self.drop_request(TimeoutException(data))
+            data += chunk
+        connection.settimeout(None)
+        return data[: data.index(b"\r\n") + 2]
 
-                # Check URL conformity.
-                check_url(url, self.port)
+    async def read_stream_request(self, reader):
+        """
+        Read the request line on an asyncio stream, like ``read_request``.
+        """
+        deadline = time.monotonic() + self.config.request_timeout
+        data = b""
+        while b"\r\n" not in data:
+            if len(data) >= MAX_REQUEST_SIZE:
+                raise self.drop_request(BadRequestException())
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise self.drop_request(TimeoutException(data))
+            try:
+                chunk = await asyncio.wait_for(
+                    reader.read(MAX_REQUEST_SIZE - len(data)), remaining
+                )
+            except (asyncio.TimeoutError, OSError):
+                chunk = b""
+            if not chunk:
+                raise self.drop_request(TimeoutException(data))
+            data += chunk
+        return data[: data.index(b"\r\n") + 2]
 
-                response = self.get_response(url)
-                connection.sendall(bytes(response))
-                do_log = True
+    def handle_connection(self, connection, address, accepted=None):
+        """
+        Serve one accepted client connection.
+
+        ``accepted`` is the monotonic time of the connection acceptance.
+        """
+        max_queue_delay = self.config.max_queue_delay
+        if max_queue_delay and accepted is not None:
+            if time.monotonic() - accepted > max_queue_delay:
+                # The request would be served too late anyway
+                self.reject_connection(connection, address, accepted)
+                return
+        timing = None
+        if self.timings:
+            timing = Timing(accepted)
+            timing.lap("accept")
+        tls = self.handshake(connection)
+        if timing is not None:
+            timing.lap("handshake")
+        if tls:
+            self.handle_request(tls, address, timing)
+
+    def handle_request(self, connection, address, timing=None):
+        """
+        Read the request on a TLS connection and send the response.
+
+        If a ``timing`` is given, the duration of each phase is measured.
+        """
+        started = time.monotonic()
+        request = response = None
+        url = ""
+        do_log = False
+        size = 0
+        try:
+            # Parse and check URL conformity.
+            data = self.read_request(connection)
+            request = Request.parse(data, self.port, address)
+            url = request.url
+
+            if timing is None:
+                response = self.get_response(request)
+                for chunk in response.stream():
+                    connection.sendall(chunk)
+                    size += len(chunk)
+            else:
+                timing.lap("recv")
+                response = self.get_response(request, timing)
+                for chunk in response.stream():
+                    timing.lap("encode")
+                    connection.sendall(chunk)
+                    size += len(chunk)
+                    timing.lap("send")
+            do_log = True
+        except Exception as exc:
+            # No error response if the response has been partially sent.
+            error_response = self.exception_handling(exc, None if size else connection)
+            if error_response is not None:
+                response = error_response
+                size = len(error_response)
+        finally:
+            connection.close()
+            if response is not None:
+                self.record_request(request, response, started, size)
+            if timing is not None:
+                self.record_timing(request, response, timing)
+            if do_log:
+                if timing is not None and self.config.log_timings:
+                    self.log_access(address, url, response, size, timing)
+                else:
+                    self.log_access(address, url, response, size)
+
+    def get_slow_down_response(self, delay=None):
+        """
+        Return the pre-encoded 44 SLOW DOWN response for this delay, the
+        configured one by default.
+        """
+        if delay is None:
+            return self.slow_down_response
+        response = self.slow_down_responses.get(delay)
+        if response is None:
+            response = SlowDownResponse(delay)
+            bytes(response)
+            self.slow_down_responses[delay] = response
+        return response
+
+    def reject_connection(
+        self, connection, address, accepted, delay=None, name="rejected_requests"
+    ):
+        """
+        Answer a connection with the pre-encoded 44 SLOW DOWN response, without
+        handling its request.
+
+        The rejection is counted by the ``name`` attribute and metric.
+        """
+        tls = self.handshake(connection)
+        if tls is not None:
+            self.send_rejection(tls, address, accepted, delay, name)
+
+    def send_rejection(
+        self, tls, address, accepted, delay=None, name="rejected_requests"
+    ):
+        """
+        Send the 44 SLOW DOWN response on a TLS connection, and close it.
+        """
+        response = self.get_slow_down_response(delay)
+        size = 0
+        try:
+            tls.sendall(bytes(response))
+            size = len(response)
+            # Closing the connection with an unread request would reset it, and
+            # the client may never get the response.
+            tls.settimeout(self.REJECTION_TIMEOUT)
+            tls.recv(MAX_REQUEST_SIZE)
+        except OSError:
+            pass
+        finally:
+            tls.close()
+        self.count_rejection(address, response, accepted, size, name)
+
+    def count_rejection(
+        self, address, response=None, started=None, size=0, name="rejected_requests"
+    ):
+        """
+        Count a rejected connection, either ``rejected_requests`` (admission
+        control) or ``rate_limited_requests``, and log it if it has been answered.
+        """
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+        self.metrics.increment(name)
+        if response is not None:
+            self.record_request(None, response, started, size)
+            self.log_access(address, "", response, size)
+
+    def record_request(self, request, response, started, size):
+        """
+        Record the metrics of a request, started at the ``started`` monotonic time.
+        """
+        self.metrics.record_request(
+            request.route if request is not None else None,
+            response.status,
+            time.monotonic() - started,
+            size,
+        )
+
+    def mainloop(self, server, executor=None, rejector=None):
+        """
+        Accept the client connections and serve them.
+
+        If an ``executor`` is given, connections (and their TLS handshake) are
+        handed to its workers, otherwise they're served one at a time by
+        ``serve_sync``. At most ``max_in_flight`` connections are handed to the
+        workers, if it's set.
+
+        Connections rejected by the admission control or by the rate limiter are
+        answered with 44 SLOW DOWN by the ``rejector`` workers, or closed if
+        they're busy too. Without ``rejector``, they're answered right away.
+        """
+        if not executor:
+            self.serve_sync(server)
+            return
+        limiter = self.rate_limiter
+        max_in_flight = self.config.max_in_flight
+        # Don't accept more connections than available workers, or than the
+        # in-flight cap.
+        slots = BoundedSemaphore(max_in_flight or self.config.workers)
+        if rejector:
+            rejection_slots = BoundedSemaphore(self.MAX_PENDING_REJECTIONS)
+
+        def reject(connection, address, accepted, delay=None, name="rejected_requests"):
+            if rejector is None:
+                self.reject_connection(connection, address, accepted, delay, name)
+            elif rejection_slots.acquire(blocking=False):
+                future = rejector.submit(
+                    self.reject_connection, connection, address, accepted, delay, name
+                )
+                future.add_done_callback(lambda future: rejection_slots.release())
+            else:
+                connection.close()
+                self.count_rejection(address, name=name)
+
+        while True:
+            connection = None
+            try:
+                connection, (address, _) = server.accept()
+                accepted = time.monotonic()
+                if limiter is not None:
+                    delay = limiter.acquire(address)
+                    if delay:
+                        reject(
+                            connection,
+                            address,
+                            accepted,
+                            delay,
+                            "rate_limited_requests",
+                        )
+                        continue
+                if not max_in_flight:
+                    slots.acquire()
+                elif not slots.acquire(blocking=False):
+                    # Over the cap: the connection is never queued.
+                    if limiter is not None:
+                        limiter.release(address)
+                    reject(connection, address, accepted)
+                    continue
+                future = executor.submit(
+                    self.handle_connection, connection, address, accepted
+                )
+                future.add_done_callback(
+                    partial(self.release_connection, slots, address)
+                )
             except KeyboardInterrupt:
                 print("bye")
                 sys.exit()
             except Exception as exc:
                 self.exception_handling(exc, connection)
-            finally:
                 if connection:
                     connection.close()
-                if do_log:
-                    self.log_access(address, url, response)
 
-    def run(self):
+    def serve_sync(self, server):
         """
-        Main run function.
+        Accept the client connections and serve them one at a time, in a single
+        thread (``sync`` engine).
 
-        Load the configuration from the command line args.
-        Launch the server
+        The TLS handshakes don't block: the pending ones progress together, and
+        each connection is served as soon as its handshake is complete. Handshakes
+        that don't complete within ``handshake_timeout`` are aborted, so clients
+        that never complete theirs don't hold the other ones.
+        """
+        selector = selectors.DefaultSelector()
+        server.setblocking(False)
+        selector.register(server, selectors.EVENT_READ)
+        pending = {}
+        while True:
+            tls = None
+            try:
+                timeout = None
+                if pending:
+                    deadline = min(entry.deadline for entry in pending.values())
+                    timeout = max(0, deadline - time.monotonic())
+                for key, _ in selector.select(timeout):
+                    if key.fileobj is server:
+                        tls = self.accept_handshake(server, pending)
+                    else:
+                        tls = key.fileobj
+                    if tls is not None:
+                        self.continue_handshake(tls, selector, pending)
+                    tls = None
+                now = time.monotonic()
+                for tls, entry in list(pending.items()):
+                    if entry.deadline <= now:
+                        self.drop_handshake(tls, selector, pending)
+                tls = None
+            except KeyboardInterrupt:
+                print("bye")
+                sys.exit()
+            except Exception as exc:
+                self.exception_handling(exc, None)
+                if tls is not None and tls in pending:
+                    self.drop_handshake(tls, selector, pending)
+
+    def accept_handshake(self, server, pending):
+        """
+        Accept a connection of the ``sync`` engine, and add it to the ``pending``
+        handshakes.
+
+        Return its TLS connection, or None if there was no connection to accept,
+        or if there are too many pending handshakes.
+        """
+        try:
+            connection, (address, _) = server.accept()
+        except BlockingIOError:
+            # Accepted by another process
+            return None
+        accepted = time.monotonic()
+        delay = None
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.acquire(address)
+        timing = None
+        if self.timings:
+            timing = Timing(accepted)
+            timing.lap("accept")
+        connection.setblocking(False)
+        tls = self.context.wrap_socket(
+            connection, server_side=True, do_handshake_on_connect=False
+        )
+        if len(pending) >= self.MAX_PENDING_HANDSHAKES:
+            self.abort_handshake(tls)
+            if not delay and self.rate_limiter is not None:
+                self.rate_limiter.release(address)
+            return None
+        deadline = accepted + self.config.handshake_timeout
+        pending[tls] = PendingHandshake(address, accepted, deadline, delay, timing)
+        return tls
+
+    def continue_handshake(self, tls, selector, pending):
+        """
+        Make progress on a pending handshake of the ``sync`` engine, and serve the
+        connection once it's complete.
+        """
+        try:
+            tls.do_handshake()
+        except ssl.SSLWantReadError:
+            events = selectors.EVENT_READ
+        except ssl.SSLWantWriteError:
+            events = selectors.EVENT_WRITE
+        except OSError:
+            # SSL errors and resets
+            self.drop_handshake(tls, selector, pending)
+            return
+        else:
+            entry = self.forget_handshake(tls, selector, pending)
+            self.serve_handshaken(tls, entry)
+            return
+        try:
+            selector.modify(tls, events)
+        except KeyError:
+            selector.register(tls, events)
+
+    def forget_handshake(self, tls, selector, pending):
+        """
+        Remove a connection from the pending handshakes, and return its entry.
+        """
+        try:
+            selector.unregister(tls)
+        except KeyError:
+            pass
+        return pending.pop(tls)
+
+    def drop_handshake(self, tls, selector, pending):
+        """
+        Abort a pending handshake of the ``sync`` engine.
+        """
+        entry = self.forget_handshake(tls, selector, pending)
+        self.abort_handshake(tls)
+        if not entry.delay and self.rate_limiter is not None:
+            self.rate_limiter.release(entry.address)
+
+    def serve_handshaken(self, tls, entry):
+        """
+        Serve a connection of the ``sync`` engine whose handshake is complete.
+
+        Rate limited clients are answered with 44 SLOW DOWN.
+        """
+        tls.setblocking(True)
+        self.count_handshake(tls)
+        if entry.timing is not None:
+            entry.timing.lap("handshake")
+        if entry.delay:
+            self.send_rejection(
+                tls, entry.address, entry.accepted, entry.delay, "rate_limited_requests"
+            )
+            return
+        try:
+            self.handle_request(tls, entry.address, entry.timing)
+        finally:
+            if self.rate_limiter is not None:
+                self.rate_limiter.release(entry.address)
+
+    def release_connection(self, slots, address, future=None):
+        """
+        Release the worker slot and the rate limiter entry of a served connection.
+        """
+        slots.release()
+        if self.rate_limiter is not None:
+            self.rate_limiter.release(address)
+
+    async def handle_stream(self, reader, writer):
+        """
+        Serve one client connection of the asyncio engine.
+
+        Same workflow as ``handle_connection``, using the asyncio streams.
+        """
+        started = time.monotonic()
+        address = writer.get_extra_info("peername")[0]
+        limiter = self.rate_limiter
+        if limiter is not None:
+            delay = limiter.acquire(address)
+            if delay:
+                await self.reject_stream(
+                    writer, started, delay, "rate_limited_requests"
+                )
+                return
+        max_in_flight = self.config.max_in_flight
+        if max_in_flight and self.in_flight >= max_in_flight:
+            if limiter is not None:
+                limiter.release(address)
+            await self.reject_stream(writer, started)
+            return
+        self.in_flight += 1
+        # The connection acceptance and the handshake are handled by asyncio.
+        timing = Timing(started) if self.timings else None
+        request = response = None
+        url = ""
+        do_log = False
+        size = 0
+        ssl_object = writer.get_extra_info("ssl_object")
+        if ssl_object:
+            self.count_handshake(ssl_object)
+        try:
+            # Parse and check URL conformity.
+            data = await self.read_stream_request(reader)
+            request = Request.parse(data, self.port, address)
+            url = request.url
+
+            if timing is not None:
+                timing.lap("recv")
+            response = self.get_response(request, timing)
+            for chunk in response.stream():
+                if timing is not None:
+                    timing.lap("encode")
+                writer.write(chunk)
+                await writer.drain()
+                size += len(chunk)
+                if timing is not None:
+                    timing.lap("send")
+            do_log = True
+        except Exception as exc:
+            error_response = self.get_error_response(exc)
+            try:
+                # No error response if the response has been partially sent.
+                if error_response and not size:
+                    writer.write(bytes(error_response))
+                    await writer.drain()
+                    response = error_response
+                    size = len(error_response)
+            except Exception as exc:
+                self.log(f"Exception while processing exception… {exc}", error=True)
+        finally:
+            self.in_flight -= 1
+            if limiter is not None:
+                limiter.release(address)
+            writer.close()
+            if response is not None:
+                self.record_request(request, response, started, size)
+            if timing is not None:
+                self.record_timing(request, response, timing)
+            if do_log:
+                if timing is not None and self.config.log_timings:
+                    self.log_access(address, url, response, size, timing)
+                else:
+                    self.log_access(address, url, response, size)
+
+    async def reject_stream(
+        self, writer, started, delay=None, name="rejected_requests"
+    ):
+        """
+        Answer an asyncio connection with the pre-encoded 44 SLOW DOWN response,
+        without reading its request.
+        """
+        address = writer.get_extra_info("peername")[0]
+        response = self.get_slow_down_response(delay)
+        size = 0
+        try:
+            writer.write(bytes(response))
+            await writer.drain()
+            size = len(response)
+        except Exception:
+            pass
+        finally:
+            writer.close()
+        self.count_rejection(address, response, started, size, name)
+
+    def get_ssl_context(self):
+        """
+        Return the server-side SSLContext, loaded with the certificate files.
         """
-        # Loading config only at runtime, not initialization
-        self.port = self.config.port
         context = SSLContext(PROTOCOL_TLS_SERVER)
         context.load_cert_chain(self.config.certfile, self.config.keyfile)
+        # Handshake tuning
+        if not self.config.session_tickets:
+            context.options |= ssl.OP_NO_TICKET
+        if self.config.ecdh_curve:
+            context.set_ecdh_curve(self.config.ecdh_curve)
+        if self.config.ciphers:
+            context.set_ciphers(self.config.ciphers)
+            # Use the server's cipher ordering, not the client's
+            context.options |= ssl.OP_CIPHER_SERVER_PREFERENCE
+        return context
+
+    def run_asyncio(self, reuse_port=False):
+        """
+        Launch the server using the asyncio engine.
+
+        Each connection is served by its own task, so a slow client doesn't hold
+        the other ones. The TLS handshake is performed by the event loop.
+        """
+        kwargs = {}
+        if sys.version_info >= (3, 7):
+            kwargs["ssl_handshake_timeout"] = self.config.handshake_timeout
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        server = loop.run_until_complete(
+            asyncio.start_server(
+                self.handle_stream,
+                self.config.ip,
+                self.config.port,
+                ssl=self.context,
+                backlog=self.config.nb_connections,
+                reuse_port=reuse_port or None,
+                **kwargs,
+            )
+        )
+        print(f"Application started…, listening to {self.config.ip}:{self.config.port}")
+        try:
+            loop.run_forever()
+        except KeyboardInterrupt:
+            print("bye")
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    def serve(self, engine, reuse_port=False):
+        """
+        Bind the listening socket and serve the clients with the given engine.
+
+        With ``reuse_port``, several processes can listen to the same address.
+        """
+        if engine == "asyncio":
+            self.run_asyncio(reuse_port)
+            return
 
         with socket(AF_INET, SOCK_STREAM) as server:
+            if reuse_port:
+                server.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
             server.bind((self.config.ip, self.config.port))
             server.listen(self.config.nb_connections)
-            print(self.BANNER)
-            with context.wrap_socket(server, server_side=True) as tls:
-                print(
-                    f"Application started…, listening to {self.config.ip}:{self.config.port}"
-                )
-                self.mainloop(tls)
+            print(
+                f"Application started…, listening to {self.config.ip}:{self.config.port}"
+            )
+            if engine == "threads":
+                rejector = None
+                if self.config.max_in_flight or self.rate_limiter is not None:
+                    rejector = ThreadPoolExecutor(self.REJECTION_WORKERS)
+                with ThreadPoolExecutor(self.config.workers) as executor:
+                    self.mainloop(server, executor, rejector)
+            else:
+                self.mainloop(server)
+
+    def spawn_worker(self, engine):
+        """
+        Fork a worker process serving the clients. Return its pid.
+        """
+        pid = os.fork()
+        if pid:
+            return pid
+        # Worker process: it never goes back to the supervisor code.
+        self.access_log.after_fork()
+        # Exit cleanly (and write the pending logs) when the supervisor stops.
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit())
+        exit_code = 1
+        try:
+            self.serve(engine, reuse_port=True)
+            exit_code = 0
+        except SystemExit:
+            exit_code = 0
+        except Exception as exc:
+            self.log(f"Worker {os.getpid()} crashed: {exc}", error=True)
+        finally:
+            self.access_log.flush()
+            os._exit(exit_code)
+
+    def supervise(self, engine):
+        """
+        Run the configured number of worker processes.
+
+        Each worker binds its own listening socket (using ``SO_REUSEPORT``), and
+        any worker that dies is restarted.
+        """
+        if SO_REUSEPORT is None:
+            raise ImproperlyConfigured(
+                "Several processes require SO_REUSEPORT, unavailable on this system"
+            )
+        workers = set()
+        try:
+            while True:
+                while len(workers) < self.config.processes:
+                    workers.add(self.spawn_worker(engine))
+                pid, status = os.wait()
+                if pid in workers:
+                    workers.remove(pid)
+                    self.log(f"Worker {pid} exited ({status}), restarting…", error=True)
+                    # Don't loop too fast if workers crash at startup.
+                    time.sleep(self.RESTART_DELAY)
+        except KeyboardInterrupt:
+            print("bye")
+        finally:
+            for pid in workers:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+
+    def run(self, engine=None):
+        """
+        Main run function.
+
+        Load the configuration from the command line args.
+        Launch the server, using the ``engine`` argument or the configured one.
+        """
+        # Loading config only at runtime, not initialization
+        self.port = self.config.port
+        engine = engine or self.config.engine
+        if engine not in self.ENGINES:
+            raise ImproperlyConfigured(f"Unknown engine: `{engine}`")
+        if self.config.processes < 1:
+            raise ImproperlyConfigured("The number of processes should be at least 1")
+        self.context = self.get_ssl_context()
+
+        print(self.BANNER)
+        if self.config.processes > 1:
+            self.supervise(engine)
+        else:
+            self.serve(engine)
 
 
 __all__ = [
@@ -305,10 +1316,21 @@ __all__ = [
     # Exceptions
     "ImproperlyConfigured",
     "TemplateError",
+    "BadRequestException",
+    "ProxyRequestRefusedException",
+    "TimeoutException",
+    # Requests
+    "Request",
     # Handlers
     "Handler",
     "StaticHandler",
     "TemplateHandler",
+    "MetricsHandler",
+    # Metrics
+    "Metrics",
+    "Timing",
+    # Limits
+    "RateLimiter",
     # Responses
     "crlf",  # Response tool
     "Response",
@@ -320,9 +1342,13 @@ __all__ = [
     "PermanentFailureResponse",
     "NotFoundResponse",
     "BadRequestResponse",
+    "SlowDownResponse",
     # Advanced responses
     "DocumentResponse",
     "DirectoryListingResponse",
+    "EncodedResponse",
     "TextResponse",
     "TemplateResponse",
+    "CompiledTemplateResponse",
+    "MetricsResponse",
 ]
@@ -0,0 +1,288 @@
+"""
+Gemeaux load generator
+
+Start an App on the loopback interface, with a self-signed certificate, and
+drive it with concurrent Gemini clients. The results are printed as JSON.
+
+Usage: python -m gemeaux.bench [--engine threads] [--concurrency 10] …
+"""
+import json
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from os.path import join
+from threading import Thread
+
+from . import App, ImproperlyConfigured, StaticHandler, TemplateHandler, ZeroConfig
+
+# Route name -> (requested path, expected status)
+ROUTES = {
+    "static": ("/static/index.gmi", "20"),
+    "template": ("/template", "20"),
+    "listing": ("/static/listing/", "20"),
+    "error": ("/not-found", "51"),
+}
+# Number of files in the listed directory
+LISTING_SIZE = 100
+
+
+def make_certificate(directory):
+    """
+    Generate a self-signed certificate for localhost, using the openssl command.
+
+    Return the ``(certfile, keyfile)`` paths.
+    """
+    certfile, keyfile = join(directory, "cert.pem"), join(directory, "key.pem")
+    command = [
+        "openssl",
+        "req",
+        "-new",
+        "-x509",
+        "-days",
+        "1",
+        "-nodes",
+        "-newkey",
+        "rsa:2048",
+        "-subj",
+        "/CN=localhost",
+        "-out",
+        certfile,
+        "-keyout",
+        keyfile,
+    ]
+    try:
+        subprocess.run(
+            command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise ImproperlyConfigured(
+            f"Can't generate a certificate with openssl ({exc}), "
+            "use the --certfile and --keyfile options"
+        )
+    return certfile, keyfile
+
+
+def make_site(directory):
+    """
+    Write the static files and the template served by the benchmark.
+    """
+    static_dir = join(directory, "static")
+    os.makedirs(join(static_dir, "listing"))
+    with open(join(static_dir, "index.gmi"), "w") as fd:
+        fd.write("# Benchmark\n\n")
+        fd.write("A static document, with a few lines of text.\n" * 100)
+    for index in range(LISTING_SIZE):
+        with open(join(static_dir, "listing", f"page-{index}.gmi"), "w") as fd:
+            fd.write(f"# Page {index}\n")
+    template_file = join(directory, "template.txt")
+    with open(template_file, "w") as fd:
+        fd.write("# $title\n\n$body\n")
+    return static_dir, template_file
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, rank):
+    """
+    Return the ``rank`` percentile of sorted values (nearest-rank method).
+    """
+    if not values:
+        return None
+    index = max(0, math.ceil(rank / 100 * len(values)) - 1)
+    return values[index]
+
+
+class BenchTemplateHandler(TemplateHandler):
+    def get_context(self):
+        return {"title": "Benchmark", "body": "A rendered template.\n" * 100}
+
+
+def serve(options, directory, certfile, keyfile, port):
+    """
+    Run the benchmarked App (in a child process).
+    """
+
+    class BenchConfig(ZeroConfig):
+        ip = "127.0.0.1"
+        engine = options.engine
+        workers = options.workers
+        processes = options.processes
+        nb_connections = 128
+        # Logging every request would be benchmarked too.
+        log_sample_rate = 0
+
+    BenchConfig.port = port
+    BenchConfig.certfile = certfile
+    BenchConfig.keyfile = keyfile
+    static_dir, template_file = make_site(directory)
+    BenchTemplateHandler.template_file = template_file
+    urls = {
+        "/static": StaticHandler(static_dir),
+        "/template": BenchTemplateHandler(),
+    }
+    # Hide the banner and the error logs (of the "error" route)
+    sys.stdout = sys.stderr = open(os.devnull, "w")
+    App(urls, config=BenchConfig()).run()
+
+
+def wait_for_server(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"The server didn't start on port {port}")
+
+
+class Client(Thread):
+    """
+    Gemini client, sending requests one after the other until the deadline.
+    """
+
+    def __init__(self, port, path, status, deadline):
+        super().__init__(daemon=True)
+        self.port = port
+        self.request = f"gemini://localhost:{port}{path}\r\n".encode()
+        self.status = status.encode()
+        self.deadline = deadline
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+        self.latencies = []
+        self.bytes_received = 0
+        self.errors = 0
+
+    def get(self):
+        """
+        Send the request, and return the number of bytes received.
+        """
+        size = 0
+        with socket.create_connection(("127.0.0.1", self.port), timeout=10) as sock:
+            with self.context.wrap_socket(sock, server_hostname="localhost") as tls:
+                tls.sendall(self.request)
+                data = tls.recv(65536)
+                if not data.startswith(self.status):
+                    raise ValueError(f"Unexpected response: {data[:30]}")
+                while data:
+                    size += len(data)
+                    data = tls.recv(65536)
+        return size
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            started = time.monotonic()
+            try:
+                size = self.get()
+            except Exception:
+                self.errors += 1
+                continue
+            self.latencies.append(time.monotonic() - started)
+            self.bytes_received += size
+
+
+def bench_route(port, route, concurrency, duration):
+    """
+    Run the clients against a route, and return their results.
+    """
+    path, status = ROUTES[route]
+    started = time.monotonic()
+    clients = [
+        Client(port, path, status, started + duration) for _ in range(concurrency)
+    ]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.monotonic() - started
+    latencies = sorted(latency for client in clients for latency in client.latencies)
+    received = sum(client.bytes_received for client in clients)
+
+    def milliseconds(value):
+        return None if value is None else round(value * 1000, 3)
+
+    return {
+        "path": path,
+        "requests": len(latencies),
+        "errors": sum(client.errors for client in clients),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "bytes_per_second": round(received / elapsed),
+        "latency_ms": {
+            "p50": milliseconds(percentile(latencies, 50)),
+            "p95": milliseconds(percentile(latencies, 95)),
+            "p99": milliseconds(percentile(latencies, 99)),
+        },
+    }
+
+
+def main(argv=None):
+    parser = ArgumentParser("Gemeaux load generator")
+    parser.add_argument("--engine", default="threads", choices=App.ENGINES)
+    parser.add_argument("--workers", default=10, type=int)
+    parser.add_argument("--processes", default=1, type=int)
+    parser.add_argument(
+        "--concurrency", default=10, type=int, help="Number of concurrent clients"
+    )
+    parser.add_argument(
+        "--duration", default=5, type=float, help="Duration of each route run, in s"
+    )
+    parser.add_argument(
+        "--routes",
+        nargs="+",
+        default=list(ROUTES),
+        choices=list(ROUTES),
+        help="Routes to benchmark — default: all",
+    )
+    parser.add_argument("--certfile", help="Certificate file (generated if absent)")
+    parser.add_argument("--keyfile", help="Key file (generated if absent)")
+    options = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = options.certfile, options.keyfile
+        if not (certfile and keyfile):
+            certfile, keyfile = make_certificate(directory)
+        port = get_free_port()
+        server = multiprocessing.Process(
+            target=serve, args=(options, directory, certfile, keyfile, port)
+        )
+        server.start()
+        try:
+            wait_for_server(port)
+            results = {
+                route: bench_route(port, route, options.concurrency, options.duration)
+                for route in options.routes
+            }
+        finally:
+            # Stop the server (and its workers) like a Ctrl-C
+            os.kill(server.pid, signal.SIGINT)
+            server.join(10)
+            if server.is_alive():
+                server.terminate()
+
+    report = {
+        "engine": options.engine,
+        "workers": options.workers,
+        "processes": options.processes,
+        "concurrency": options.concurrency,
+        "duration": options.duration,
+        "python": sys.version.split()[0],
+        "routes": results,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
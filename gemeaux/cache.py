@@ -0,0 +1,231 @@
+"""
+Gemeaux caching tools
+"""
+import sys
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+
+
+class LRUCache:
+    """
+    Thread-safe Least Recently Used cache, bounded by the total size of its items.
+
+    The size of each item is given when it's stored (e.g. its length in bytes).
+    When the budget is exceeded, the least recently used items are evicted.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.items = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for ``key`` and mark it as recently used.
+        """
+        with self.lock:
+            try:
+                value, size = self.items[key]
+            except KeyError:
+                return default
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value, size=1):
+        """
+        Store a value. Items bigger than the whole budget are not stored.
+        """
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+            if size > self.max_size:
+                return
+            self.items[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.size -= evicted_size
+
+    def delete(self, key):
+        """
+        Remove the item stored for ``key``, if any.
+        """
+        with self.lock:
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+class CacheEntry:
+    """
+    Cached item, along with the file metadata used to validate it.
+    """
+
+    __slots__ = ("value", "path", "mtime", "size", "checked")
+
+    def __init__(self, value, path, mtime, size, checked):
+        self.value = value
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        # Last time the file metadata was checked
+        self.checked = checked
+
+
+class PathInfo:
+    """
+    Metadata of a path, resolved by a StaticHandler.
+
+    * ``kind``: ``"file"``, ``"directory"``, or None if the path doesn't exist
+      (or is neither a file nor a directory).
+    * ``size``, ``mtime``: the size and modification time of the path.
+    * ``mimetype``: the mimetype of the file.
+    * ``index``: True if the directory contains the index file.
+    * ``checked``: the (monotonic) time of the resolution.
+    """
+
+    __slots__ = ("kind", "size", "mtime", "mimetype", "index", "checked")
+
+    def __init__(self, kind, size, mtime, mimetype, index, checked):
+        self.kind = kind
+        self.size = size
+        self.mtime = mtime
+        self.mimetype = mimetype
+        self.index = index
+        self.checked = checked
+
+
+class PendingRender:
+    """
+    Render in progress, shared by the requests waiting for its result.
+    """
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+def log_error(message):
+    sys.stderr.write(f"{message}\n")
+
+
+class ResponseCache:
+    """
+    Cache of rendered responses, with a time-to-live.
+
+    * Fresh entries (younger than ``ttl`` seconds) are returned as is.
+    * Stale entries (expired for less than ``stale_ttl`` seconds) are still
+      returned, while a background thread renders them again.
+    * Concurrent misses for the same key wait for a single render.
+
+    Failed background renders are counted in ``refresh_errors``, and logged by
+    the ``log`` function (to the standard error by default).
+    """
+
+    def __init__(self, ttl, stale_ttl=None, max_entries=1000, log=log_error):
+        self.ttl = ttl
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        # Key -> (value, rendering time)
+        self.entries = LRUCache(max_entries)
+        # Key -> PendingRender
+        self.renders = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        self.log = log
+
+    def get(self, key, render):
+        """
+        Return the value cached for ``key``, using ``render()`` to build it.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            value, rendered = entry
+            age = time.monotonic() - rendered
+            if age < self.ttl:
+                with self.lock:
+                    self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                pending = None
+                with self.lock:
+                    self.stale_hits += 1
+                    # Claimed under the lock, so a burst of stale hits starts a
+                    # single refresh.
+                    if key not in self.renders:
+                        pending = self.renders[key] = PendingRender()
+                if pending is not None:
+                    Thread(
+                        target=self.refresh, args=(key, render, pending), daemon=True
+                    ).start()
+                return value
+        with self.lock:
+            self.misses += 1
+        return self.load(key, render)
+
+    def load(self, key, render):
+        """
+        Render the value for ``key`` and store it.
+
+        If a render is already in progress for this key, wait for its result.
+        """
+        with self.lock:
+            pending = self.renders.get(key)
+            leader = pending is None
+            if leader:
+                pending = self.renders[key] = PendingRender()
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        return self.run_render(key, render, pending)
+
+    def run_render(self, key, render, pending):
+        """
+        Render the value for ``key``, claimed by ``pending``, and store it.
+        """
+        try:
+            pending.value = render()
+            self.entries.set(key, (pending.value, time.monotonic()))
+        except Exception as exc:
+            pending.error = exc
+            raise
+        finally:
+            with self.lock:
+                del self.renders[key]
+            pending.done.set()
+        return pending.value
+
+    def refresh(self, key, render, pending):
+        """
+        Render the value for ``key`` again, claimed by ``pending``.
+
+        On error, the stale value is kept until it expires.
+        """
+        try:
+            self.run_render(key, render, pending)
+        except Exception as exc:
+            with self.lock:
+                self.refresh_errors += 1
+            self.log(f"Error: failed to refresh the cached response {key!r}: {exc!r}")
+
+    def clear(self):
+        self.entries.clear()
@@ -1,43 +1,151 @@
+import time
+from inspect import Parameter, signature
+from os import stat
 from os.path import abspath, isdir, isfile, join
+from stat import S_ISDIR, S_ISREG
+from threading import Lock
 
+from .cache import CacheEntry, LRUCache, PathInfo, ResponseCache
 from .exceptions import ImproperlyConfigured
+from .metrics import METRICS
 from .responses import (
     DirectoryListingResponse,
     DocumentResponse,
+    EncodedResponse,
+    MetricsResponse,
+    NotFoundResponse,
     RedirectResponse,
     TemplateResponse,
+    guess_mimetype,
 )
 
+# Protects the lazy creation of the handlers response caches
+RESPONSE_CACHE_LOCK = Lock()
+# Pre-encoded response to the missing paths remembered by the StaticHandler
+NOT_FOUND_RESPONSE = NotFoundResponse("Path not found")
+bytes(NOT_FOUND_RESPONSE)
+
+
+def takes_request(method):
+    """
+    Return True if the (bound) method accepts the ``request`` argument, after the
+    ``url`` and the ``path``.
+
+    Methods written before the ``request`` argument was added only take two.
+    """
+    try:
+        parameters = signature(method).parameters.values()
+    except (TypeError, ValueError):
+        # No signature available: assume it's up to date
+        return True
+    positional = 0
+    for parameter in parameters:
+        if parameter.kind == Parameter.VAR_POSITIONAL:
+            return True
+        if parameter.kind in (
+            Parameter.POSITIONAL_ONLY,
+            Parameter.POSITIONAL_OR_KEYWORD,
+        ):
+            positional += 1
+    return positional >= 3
+
 
 class Handler:
+    # Rendered responses are cached for this number of seconds. Disabled if 0.
+    cache_ttl = 0
+    # Stale responses are served for this number of seconds while they're rendered
+    # again in the background. Defaults to ``cache_ttl``.
+    cache_stale_ttl = None
+    # Maximum number of cached responses
+    cache_max_entries = 1000
+    response_cache = None
+    # False if ``cache_key()`` is overridden without the ``request`` argument
+    cache_key_takes_request = True
+
     def __init__(self, *args, **kwargs):
         pass
 
     def get_response(self, *args, **kwargs):
         raise NotImplementedError
 
-    def handle(self, url, path):
+    def handle(self, url, path, request=None):
         """
         Handle the request to return the appropriate response.
 
         Override/write this method if you need extra processing before returning the
-        standard Response.
+        standard Response. The ``request`` gives access to the whole parsed request
+        (e.g. its ``query``).
         """
+        if self.cache_ttl:
+            return self.get_cached_response(url, path, request)
         response = self.get_response(url, path)
         return response
 
+    def cache_key(self, url, path, request=None):
+        """
+        Return the key of the cached response for this request.
+
+        Override this method if the response doesn't only depend on the path and
+        the query string.
+        """
+        if request is not None and request.query:
+            return f"{path}?{request.query}"
+        return path
+
+    def get_cached_response(self, url, path, request=None):
+        """
+        Return the cached response for this request, rendering it if needed.
+        """
+        if self.response_cache is None:
+            with RESPONSE_CACHE_LOCK:
+                if self.response_cache is None:
+                    self.cache_key_takes_request = takes_request(self.cache_key)
+                    self.response_cache = ResponseCache(
+                        self.cache_ttl, self.cache_stale_ttl, self.cache_max_entries
+                    )
+        if self.cache_key_takes_request:
+            key = self.cache_key(url, path, request)
+        else:
+            key = self.cache_key(url, path)
+        return self.response_cache.get(
+            key,
+            lambda: EncodedResponse.from_response(self.get_response(url, path)),
+        )
+
 
 class StaticHandler(Handler):
     """
     Handler for serving static Gemini pages from a directory on your filesystem.
     """
 
-    def __init__(self, static_dir, directory_listing=True, index_file="index.gmi"):
+    def __init__(
+        self,
+        static_dir,
+        directory_listing=True,
+        index_file="index.gmi",
+        cache_size=0,
+        cache_check_interval=1,
+        not_found_cache_size=0,
+        not_found_cache_ttl=10,
+        stat_cache_size=0,
+        stat_cache_interval=1,
+    ):
         self.static_dir = abspath(static_dir)
         if not isdir(self.static_dir):
             raise ImproperlyConfigured(f"{self.static_dir} is not a directory")
         self.directory_listing = directory_listing
         self.index_file = index_file
+        # Document cache, bounded by its total size in bytes. Disabled if 0.
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.cache_check_interval = cache_check_interval
+        # Missing paths -> expiration time. Disabled if 0.
+        self.not_found_cache = None
+        if not_found_cache_size:
+            self.not_found_cache = LRUCache(not_found_cache_size)
+        self.not_found_cache_ttl = not_found_cache_ttl
+        # Path -> PathInfo. Disabled if 0.
+        self.stat_cache = LRUCache(stat_cache_size) if stat_cache_size else None
+        self.stat_cache_interval = stat_cache_interval
 
     def __repr__(self):
         return f"<StaticHandler: {self.static_dir}>"
@@ -53,6 +161,10 @@ class StaticHandler(Handler):
             * If activated, it'll return the DirectoryListingResponse
             * If deactivated => raises a FileNotFoundError.
         * If none of the cases above is satisfied, it raises a FileNotFoundError
+
+        If the not found cache is activated, missing paths are answered with a
+        pre-encoded NotFoundResponse instead, and remembered for
+        ``not_found_cache_ttl`` seconds without checking the file system again.
         """
         # A bit paranoid…
         if path.startswith(url):
@@ -60,25 +172,135 @@ class StaticHandler(Handler):
         if path.startswith("/"):  # Should be a relative path
             path = path[1:]
 
+        if self.not_found_cache is not None:
+            expires = self.not_found_cache.get(path)
+            if expires is not None:
+                if time.monotonic() < expires:
+                    return NOT_FOUND_RESPONSE
+                self.not_found_cache.delete(path)
         full_path = join(self.static_dir, path)
         # print(f"StaticHandler: path='{full_path}'")
+        cache_key = None
+        if self.cache is not None:
+            cache_key = abspath(full_path)
+            if not path or path.endswith("/"):
+                # Not the same resource as the path without a trailing slash
+                cache_key = join(cache_key, "")
+            response = self.get_cached_document(cache_key)
+            if response is not None:
+                return response
+        info = self.resolve(full_path)
         # The path leads to a directory
-        if isdir(full_path):
+        if info.kind == "directory":
             # Directory. Redirect if not root?
             if path and not path.endswith("/"):
                 return RedirectResponse(f"{path}/")
             # Directory -> index?
-            index_path = join(full_path, self.index_file)
-            if isfile(index_path):
-                return DocumentResponse(index_path, self.static_dir)
+            if info.index:
+                index_path = join(full_path, self.index_file)
+                return self.get_document(index_path, cache_key)
             elif self.directory_listing:
-                return DirectoryListingResponse(full_path, self.static_dir)
+                return DirectoryListingResponse(full_path, self.static_dir, info)
         # The path is a file
-        elif isfile(full_path):
-            return DocumentResponse(full_path, self.static_dir)
+        elif info.kind == "file":
+            return self.get_document(full_path, cache_key, info)
         # Else, not found or error
+        if self.not_found_cache is not None:
+            expires = time.monotonic() + self.not_found_cache_ttl
+            self.not_found_cache.set(path, expires)
+            return NOT_FOUND_RESPONSE
         raise FileNotFoundError("Path not found")
 
+    def resolve(self, full_path):
+        """
+        Return the PathInfo of this path.
+
+        If the stat cache is activated, the metadata is read again at most every
+        ``stat_cache_interval`` seconds.
+        """
+        if self.stat_cache is None:
+            return self.stat_path(full_path)
+        info = self.stat_cache.get(full_path)
+        if info is None or time.monotonic() - info.checked >= self.stat_cache_interval:
+            info = self.stat_path(full_path)
+            self.stat_cache.set(full_path, info)
+        return info
+
+    def stat_path(self, full_path):
+        """
+        Read the metadata of this path, using a single ``stat`` call (and another
+        one for the index file of a directory).
+        """
+        now = time.monotonic()
+        try:
+            path_stat = stat(full_path)
+        except (OSError, ValueError):
+            # Missing, unreadable, or invalid path
+            return PathInfo(None, 0, None, None, False, now)
+        if S_ISDIR(path_stat.st_mode):
+            index = isfile(join(full_path, self.index_file))
+            return PathInfo("directory", 0, path_stat.st_mtime, None, index, now)
+        if S_ISREG(path_stat.st_mode):
+            return PathInfo(
+                "file",
+                path_stat.st_size,
+                path_stat.st_mtime,
+                guess_mimetype(full_path),
+                False,
+                now,
+            )
+        return PathInfo(None, 0, None, None, False, now)
+
+    def get_document(self, full_path, cache_key=None, info=None):
+        """
+        Return the DocumentResponse for this file.
+
+        If the cache is activated, the encoded response is stored in the cache.
+        """
+        # Metadata is read *before* the content, so a change in-between will
+        # invalidate the cache entry.
+        if info is None:
+            info = self.resolve(full_path)
+        if info.kind != "file":
+            raise FileNotFoundError("Path not found")
+        if cache_key is None:
+            return DocumentResponse(full_path, self.static_dir, info)
+        response = DocumentResponse(full_path, self.static_dir, info)
+        if response.streaming or info.size > self.cache.max_size:
+            # Big documents are not cached
+            return response
+        response = EncodedResponse.from_response(response)
+        entry = CacheEntry(
+            response,
+            full_path,
+            info.mtime,
+            info.size,
+            time.monotonic(),
+        )
+        self.cache.set(cache_key, entry, len(response.payload))
+        return response
+
+    def get_cached_document(self, cache_key):
+        """
+        Return the cached response for this key, or None.
+
+        The file metadata is checked at most every ``cache_check_interval``
+        seconds (through the stat cache, if it's activated). If the file was
+        modified or removed, the entry is discarded.
+        """
+        entry = self.cache.get(cache_key)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry.checked < self.cache_check_interval:
+            return entry.value
+        info = self.resolve(entry.path)
+        if (info.kind, info.mtime, info.size) != ("file", entry.mtime, entry.size):
+            self.cache.delete(cache_key)
+            return None
+        entry.checked = now
+        return entry.value
+
 
 class TemplateHandler(Handler):
     """
@@ -86,13 +308,15 @@ class TemplateHandler(Handler):
     """
 
     template_file = None
+    # Set to CompiledTemplateResponse to use the Gemeaux template engine
+    response_class = TemplateResponse
 
     def get_response(self, url, path):
         """
         Feeds the context variable into the template file to return dynamic content.
         """
         context = self.get_context()
-        return TemplateResponse(self.get_template_file(), **context)
+        return self.response_class(self.get_template_file(), **context)
 
     def get_context(self):
         """
@@ -113,3 +337,27 @@ class TemplateHandler(Handler):
         raise NotImplementedError(
             "Implement a `get_template_file` method or define a `template_file` class attribute"
         )
+
+
+class MetricsHandler(Handler):
+    """
+    Handler rendering the current values of the server metrics.
+    """
+
+    def __init__(self, format="gemtext", metrics=None):
+        """
+        Arguments:
+
+        * ``format``: either ``"gemtext"`` or ``"prometheus"``.
+        * ``metrics``: the ``Metrics`` registry, the process-wide one by default.
+        """
+        if format not in MetricsResponse.FORMATS:
+            raise ImproperlyConfigured(f"Unknown metrics format: `{format}`")
+        self.format = format
+        self.metrics = metrics or METRICS
+
+    def __repr__(self):
+        return f"<MetricsHandler: {self.format}>"
+
+    def get_response(self, url, path):
+        return MetricsResponse(self.metrics, self.format)
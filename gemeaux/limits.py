@@ -0,0 +1,119 @@
+"""
+Gemeaux rate limiting tools
+"""
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class ClientState:
+    """
+    Token bucket and open connections of a client.
+    """
+
+    __slots__ = ("tokens", "updated", "connections")
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.connections = 0
+
+
+class RateLimiter:
+    """
+    Per-client rate limiter, keyed by the client IP address.
+
+    * Each client has a bucket of ``burst`` tokens, refilled at ``rate`` tokens per
+      second. Each connection takes a token.
+    * A client can't have more than ``max_connections`` open connections.
+
+    Both limits are disabled if 0.
+
+    Clients are kept from the least to the most recently seen. An idle client (no
+    open connection, full bucket) is the same as an unknown one: a few of them are
+    forgotten at each new connection. At most ``max_clients`` clients are tracked,
+    the least recently seen ones are forgotten beyond.
+    """
+
+    # Least recently seen clients checked at each new connection
+    EXPIRE_BATCH = 2
+    # Delay to send to the clients with too many open connections, in seconds
+    CONNECTIONS_DELAY = 1
+
+    def __init__(self, rate=0, burst=10, max_connections=0, max_clients=100000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_connections = max_connections
+        self.max_clients = max_clients
+        # Time to refill an empty bucket
+        self.idle_timeout = self.burst / rate if rate else 0
+        # Address -> ClientState
+        self.clients = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.clients)
+
+    def acquire(self, address, now=None):
+        """
+        Open a connection for the client.
+
+        Return 0 if it's allowed, or the number of seconds the client should wait
+        before retrying. Allowed connections have to be released.
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            state = self.clients.get(address)
+            if state is None:
+                state = self.clients[address] = ClientState(self.burst, now)
+                if len(self.clients) > self.max_clients:
+                    self.clients.popitem(last=False)
+            else:
+                self.clients.move_to_end(address)
+            if self.max_connections and state.connections >= self.max_connections:
+                return self.CONNECTIONS_DELAY
+            if self.rate:
+                elapsed = now - state.updated
+                tokens = min(self.burst, state.tokens + elapsed * self.rate)
+                state.updated = now
+                if tokens < 1:
+                    state.tokens = tokens
+                    return math.ceil((1 - tokens) / self.rate)
+                state.tokens = tokens - 1
+            state.connections += 1
+            return 0
+
+    def release(self, address):
+        """
+        Close a connection of the client.
+        """
+        with self.lock:
+            state = self.clients.get(address)
+            if state is None:
+                # Already forgotten
+                return
+            if state.connections:
+                state.connections -= 1
+            if not self.rate and not state.connections:
+                del self.clients[address]
+
+    def expire(self, now):
+        """
+        Forget the least recently seen clients, if they're idle.
+        """
+        clients = self.clients
+        for _ in range(self.EXPIRE_BATCH):
+            if not clients:
+                return
+            address = next(iter(clients))
+            state = clients[address]
+            if state.connections:
+                # Checked again later
+                clients.move_to_end(address)
+            elif now - state.updated >= self.idle_timeout:
+                del clients[address]
+            else:
+                return
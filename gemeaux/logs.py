@@ -0,0 +1,202 @@
+"""
+Gemeaux logging tools
+"""
+import atexit
+import os
+import random
+import sys
+import time
+import weakref
+from threading import Event, Lock, Thread
+
+# Writers with a flush thread, flushed once more when the process exits
+STARTED_LOGS = weakref.WeakSet()
+
+
+@atexit.register
+def flush_all():
+    """
+    Write the pending lines of every started writer.
+    """
+    for log in list(STARTED_LOGS):
+        log.flush()
+
+
+def run_flush_thread(ref):
+    """
+    Flush the writer periodically, until it's garbage collected.
+
+    The thread only keeps a weak reference to the writer, so it doesn't keep it
+    alive.
+    """
+    while True:
+        log = ref()
+        if log is None:
+            return
+        wakeup, interval = log.wakeup, log.flush_interval
+        del log
+        wakeup.wait(interval)
+        wakeup.clear()
+        log = ref()
+        if log is None:
+            return
+        log.flush()
+        del log
+
+
+class AccessLog:
+    """
+    Buffered log writer.
+
+    Lines are kept in memory and written by a background thread, every
+    ``flush_interval`` seconds or as soon as ``flush_lines`` lines are waiting,
+    so the serving threads never wait for the terminal, the pipe or the disk.
+
+    * When ``max_pending`` lines are already waiting, new lines are dropped.
+    * Access lines may be sampled, keeping only a ``sample_rate`` ratio of them.
+    * Dropped and sampled out lines are counted in the ``dropped`` attribute.
+
+    Lines are written to the standard output (or error), or to the ``path``
+    file. This file is rotated when it exceeds ``max_bytes`` (if not 0), keeping
+    ``backup_count`` old files (``path.1``, ``path.2``…).
+    """
+
+    def __init__(
+        self,
+        path=None,
+        max_bytes=0,
+        backup_count=5,
+        sample_rate=1,
+        max_pending=10000,
+        flush_lines=1000,
+        flush_interval=1,
+        timestamp_format="%d/%b/%Y:%H:%M:%S %z",
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.sample_rate = sample_rate
+        self.max_pending = max_pending
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.timestamp_format = timestamp_format
+        self.dropped = 0
+        # (line, error) couples, waiting to be written
+        self.pending = []
+        self.lock = Lock()
+        # Only one flush at a time (background thread, exit)
+        self.flush_lock = Lock()
+        self.wakeup = Event()
+        self.started = False
+        self.file = None
+        # Formatted timestamp, along with its second
+        self.cached_timestamp = (None, "")
+
+    def timestamp(self):
+        """
+        Return the current local time, formatted once per second.
+        """
+        now = int(time.time())
+        second, text = self.cached_timestamp
+        if second != now:
+            text = time.strftime(self.timestamp_format, time.localtime(now))
+            self.cached_timestamp = (now, text)
+        return text
+
+    def sample(self):
+        """
+        Return True if the next access line should be logged.
+        """
+        if self.sample_rate >= 1 or random.random() < self.sample_rate:
+            return True
+        with self.lock:
+            self.dropped += 1
+        return False
+
+    def write(self, line, error=False):
+        """
+        Add a line to the buffer.
+        """
+        if not self.started:
+            self.start()
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self.pending.append((line, error))
+            full = len(self.pending) >= self.flush_lines
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        """
+        Start the flush thread of the current process.
+        """
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        STARTED_LOGS.add(self)
+        Thread(target=run_flush_thread, args=(weakref.ref(self),), daemon=True).start()
+
+    def after_fork(self):
+        """
+        Reset the writer in a forked process, before it starts any thread.
+
+        Threads don't survive a fork, the locks may have been held by a thread of
+        the parent process, and the pending lines belong to the parent.
+        """
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.wakeup = Event()
+        self.pending = []
+        self.file = None
+        self.started = False
+
+    def flush(self):
+        """
+        Write the pending lines.
+        """
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            try:
+                if self.path:
+                    self.write_file("".join(f"{line}\n" for line, _ in pending))
+                    return
+                for error, out in ((False, sys.stdout), (True, sys.stderr)):
+                    text = "".join(f"{line}\n" for line, e in pending if e is error)
+                    if text:
+                        out.write(text)
+                        out.flush()
+            except (OSError, ValueError):
+                # Closed or broken output
+                with self.lock:
+                    self.dropped += len(pending)
+
+    def write_file(self, text):
+        data = text.encode()
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        position = self.file.tell()
+        if self.max_bytes and position and position + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+
+    def rotate(self):
+        """
+        Rename the log file to ``path.1`` (and the older ones), and reopen it.
+        """
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
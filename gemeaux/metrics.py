@@ -0,0 +1,255 @@
+"""
+Gemeaux metrics tools
+"""
+import time
+from bisect import bisect_left
+from threading import Lock
+
+# Route label of the requests that didn't match any route
+NO_ROUTE = "-"
+
+
+class Histogram:
+    """
+    Distribution of values, counted in buckets.
+
+    A value is counted in the first bucket whose upper bound is greater than or
+    equal to it. The last bucket has no upper bound.
+    """
+
+    # Request durations, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Return the ``(upper bound, count)`` couples, counting the values lower than
+        or equal to each bound. The last bound is ``"+Inf"``.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Timing:
+    """
+    Duration of each phase of a request, in seconds.
+
+    * ``accept``: from the connection acceptance to the start of its handling
+      (waiting for a worker thread).
+    * ``handshake``: TLS handshake.
+    * ``recv``: reading and parsing the request.
+    * ``route``: finding the route.
+    * ``handler``: running the handler.
+    * ``encode``: producing the response bytes.
+    * ``send``: sending them.
+
+    ``lap(phase)`` adds the time elapsed since the previous lap to the phase.
+    """
+
+    PHASES = ("accept", "handshake", "recv", "route", "handler", "encode", "send")
+
+    __slots__ = PHASES + ("started", "mark")
+
+    def __init__(self, started=None):
+        self.started = self.mark = time.monotonic() if started is None else started
+        for phase in self.PHASES:
+            setattr(self, phase, 0.0)
+
+    def lap(self, phase):
+        now = time.monotonic()
+        setattr(self, phase, getattr(self, phase) + now - self.mark)
+        self.mark = now
+
+    def __str__(self):
+        return " ".join(
+            f"{phase}={getattr(self, phase) * 1000:.3f}ms" for phase in self.PHASES
+        )
+
+
+class Metrics:
+    """
+    Registry of the server metrics.
+
+    * Requests, by route and status code.
+    * Request durations, by route.
+    * Bytes sent.
+    * Exceptions, by type.
+    * Other counters, by name (e.g. ``handshake_failures``).
+    * Request phase durations (see ``Timing``), if they're recorded.
+
+    Each request is recorded at once, under a single lock.
+    """
+
+    def __init__(self, buckets=Histogram.BUCKETS):
+        self.buckets = buckets
+        self.lock = Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.started = time.time()
+            # (route, status) -> count
+            self.requests = {}
+            # route -> Histogram
+            self.durations = {}
+            self.bytes_sent = 0
+            # Exception class name -> count
+            self.exceptions = {}
+            # Name -> count
+            self.counters = {}
+            # Request phase -> Histogram
+            self.phases = {}
+
+    def record_request(self, route, status, duration, size):
+        """
+        Record a request served on the ``route`` url (None if not found).
+        """
+        if route is None:
+            route = NO_ROUTE
+        key = (route, status)
+        with self.lock:
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.get(route)
+            if histogram is None:
+                histogram = self.durations[route] = Histogram(self.buckets)
+            histogram.observe(duration)
+            self.bytes_sent += size
+
+    def record_timing(self, timing):
+        """
+        Record the phase durations of a request.
+        """
+        with self.lock:
+            for phase in Timing.PHASES:
+                histogram = self.phases.get(phase)
+                if histogram is None:
+                    histogram = self.phases[phase] = Histogram(self.buckets)
+                histogram.observe(getattr(timing, phase))
+
+    def record_exception(self, exception):
+        name = type(exception).__name__
+        with self.lock:
+            self.exceptions[name] = self.exceptions.get(name, 0) + 1
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def render_gemtext(self):
+        """
+        Return the current values, as a Gemini document.
+        """
+        with self.lock:
+            lines = [
+                "# Metrics",
+                "",
+                f"Uptime: {time.time() - self.started:.0f}s",
+                f"Bytes sent: {self.bytes_sent}",
+            ]
+            lines.extend(
+                f"{name}: {value}" for name, value in sorted(self.counters.items())
+            )
+            lines += ["", "## Requests", ""]
+            for (route, status), count in sorted(self.requests.items()):
+                lines.append(f"* {route} {status}: {count}")
+            lines += ["", "## Durations", ""]
+            for route, histogram in sorted(self.durations.items()):
+                average = histogram.sum / histogram.count * 1000
+                lines.append(
+                    f"* {route}: {histogram.count} requests, {average:.2f}ms average"
+                )
+            lines += ["", "## Exceptions", ""]
+            for name, count in sorted(self.exceptions.items()):
+                lines.append(f"* {name}: {count}")
+            if self.phases:
+                lines += ["", "## Request phases", ""]
+            for phase in Timing.PHASES:
+                histogram = self.phases.get(phase)
+                if histogram is not None:
+                    average = histogram.sum / histogram.count * 1000
+                    lines.append(f"* {phase}: {average:.3f}ms average")
+        return "\n".join(lines) + "\n"
+
+    def render_prometheus(self):
+        """
+        Return the current values, in the Prometheus text format.
+        """
+        with self.lock:
+            lines = [
+                "# TYPE gemeaux_requests_total counter",
+                *(
+                    f'gemeaux_requests_total{{route="{label(route)}",status="{status}"}} {count}'
+                    for (route, status), count in sorted(self.requests.items())
+                ),
+                "# TYPE gemeaux_request_duration_seconds histogram",
+            ]
+            for route, histogram in sorted(self.durations.items()):
+                route = label(route)
+                for bound, count in histogram.cumulative():
+                    lines.append(
+                        f'gemeaux_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'gemeaux_request_duration_seconds_sum{{route="{route}"}} {histogram.sum}'
+                )
+                lines.append(
+                    f'gemeaux_request_duration_seconds_count{{route="{route}"}} {histogram.count}'
+                )
+            lines += [
+                "# TYPE gemeaux_sent_bytes_total counter",
+                f"gemeaux_sent_bytes_total {self.bytes_sent}",
+                "# TYPE gemeaux_exceptions_total counter",
+                *(
+                    f'gemeaux_exceptions_total{{type="{name}"}} {count}'
+                    for name, count in sorted(self.exceptions.items())
+                ),
+            ]
+            if self.phases:
+                lines.append("# TYPE gemeaux_phase_duration_seconds histogram")
+            for phase in Timing.PHASES:
+                histogram = self.phases.get(phase)
+                if histogram is None:
+                    continue
+                for bound, count in histogram.cumulative():
+                    lines.append(
+                        f'gemeaux_phase_duration_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'gemeaux_phase_duration_seconds_sum{{phase="{phase}"}} {histogram.sum}'
+                )
+                lines.append(
+                    f'gemeaux_phase_duration_seconds_count{{phase="{phase}"}} {histogram.count}'
+                )
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE gemeaux_{name}_total counter")
+                lines.append(f"gemeaux_{name}_total {value}")
+            lines.append("# TYPE gemeaux_start_time_seconds gauge")
+            lines.append(f"gemeaux_start_time_seconds {self.started}")
+        return "\n".join(lines) + "\n"
+
+
+def label(value):
+    """
+    Escape a Prometheus label value.
+    """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Process-wide metrics registry
+METRICS = Metrics()
@@ -0,0 +1,127 @@
+"""
+Gemeaux request parsing tools
+"""
+import re
+from urllib.parse import urlparse
+
+from .exceptions import (
+    BadRequestException,
+    ProxyRequestRefusedException,
+    TimeoutException,
+)
+
+# Max length of the URL, as defined by the Gemini specification.
+MAX_URL_LENGTH = 1024
+# Max length of the request line: URL + CRLF.
+MAX_REQUEST_SIZE = MAX_URL_LENGTH + 2
+# Characters that the fast path doesn't handle: whitespace, user info, fragment,
+# IPv6 addresses and backslashes.
+UNUSUAL_URL_RE = re.compile(r"[\s@#\[\\]")
+
+
+class Request:
+    """
+    Gemini request, parsed and validated once per connection.
+
+    * ``url``: the requested URL, without its CRLF.
+    * ``scheme``, ``host``, ``port``, ``path``, ``query``: the URL components. The
+      port is the server port if it's not in the URL. The query is still
+      percent-encoded.
+    * ``peer``: the client address.
+    * ``route``: the url of the matching route, once it's found.
+    """
+
+    __slots__ = ("url", "scheme", "host", "port", "path", "query", "peer", "route")
+
+    def __init__(
+        self, url, scheme="gemini", host="", port=None, path="", query="", peer=None
+    ):
+        self.url = url
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.path = path
+        self.query = query
+        self.peer = peer
+        self.route = None
+
+    def __repr__(self):
+        return f"<Request: {self.url}>"
+
+    @classmethod
+    def parse(cls, data, server_port, peer=None):
+        """
+        Parse and check the request line sent by the client.
+
+        ``data`` is the ``bytes`` received from the client, or the decoded text.
+        Raise the exception matching the error, or return the Request.
+        """
+        if isinstance(data, bytes):
+            if not data.endswith(b"\r\n"):
+                # TimeoutException will cause no response
+                raise TimeoutException(data)
+            # Don't decode requests that are too long anyway
+            if len(data) > MAX_REQUEST_SIZE:
+                raise BadRequestException
+            data = data.decode()
+        elif not data.endswith("\r\n"):
+            raise TimeoutException(data)
+        url = data[:-2]
+
+        # Fast path, for the usual `gemini://host[:port]/path?query` shape.
+        if not url.startswith("gemini://") or UNUSUAL_URL_RE.search(url):
+            return cls.parse_url(url, server_port, peer)
+        if len(url) > MAX_URL_LENGTH:
+            raise BadRequestException
+        location, _, query = url[9:].partition("?")
+        host, slash, path = location.partition("/")
+        host, colon, port = host.partition(":")
+        if colon:
+            port = check_port(port, server_port)
+        else:
+            port = server_port
+        return cls(url, "gemini", host, port, slash + path, query, peer)
+
+    @classmethod
+    def parse_url(cls, url, server_port, peer=None):
+        """
+        Parse and check an unusual URL, using ``urlparse``.
+        """
+        stripped = url.strip()
+        parsed = urlparse(stripped, "gemini")
+        # Other than Gemini will trigger a PROXY ERROR
+        if parsed.scheme != "gemini":
+            raise ProxyRequestRefusedException
+        # You need to provide the right scheme
+        if not url.startswith("gemini://"):
+            raise BadRequestException
+        if len(stripped) > MAX_URL_LENGTH:
+            raise BadRequestException
+        host, colon, port = parsed.netloc.rpartition("@")[2].rpartition(":")
+        if not colon or host.startswith("[") and not host.endswith("]"):
+            # No port, but maybe an IPv6 address
+            port = server_port
+        else:
+            port = check_port(port, server_port)
+        return cls(
+            stripped,
+            "gemini",
+            parsed.hostname or "",
+            port,
+            parsed.path,
+            parsed.query,
+            peer,
+        )
+
+
+def check_port(port, server_port):
+    """
+    Return the port of the URL as an integer, if it's the server port.
+    """
+    if not port.isdigit():
+        raise BadRequestException
+    port = int(port)
+    # Not the right port
+    if port != server_port:
+        raise ProxyRequestRefusedException
+    return port
@@ -1,10 +1,10 @@
 import mimetypes
 from itertools import chain
 from os import listdir
-from os.path import abspath, isdir, isfile
-from string import Template
+from os.path import abspath, getsize, isdir, isfile
 
 from .exceptions import TemplateError
+from .templates import COMPILED_TEMPLATES, TEMPLATES
 
 MIMETYPES = mimetypes.MimeTypes()
 # All known mimetypes have to be read in the system.
@@ -16,13 +16,64 @@ MIMETYPES.add_type("text/gemini", ".gmi")
 MIMETYPES.add_type("text/gemini", ".gemini")
 
 
+def guess_mimetype(filename):
+    """
+    Guess the mimetype of a file based on the file extension.
+    """
+    mime, encoding = MIMETYPES.guess_type(filename)
+    if encoding:
+        return f"{mime}; charset={encoding}"
+    else:
+        return mime or "application/octet-stream"
+
+
 def crlf(text):
     r"""
-    Normalize line endings to unix (``\r\n``). Text should be bytes.
+    Normalize line endings to ``\r\n``. Text should be bytes.
+
+    The last line always ends with ``\r\n``.
+    """
+    # Turn all types of linefeeds into "\n", then into the "true" linefeed
+    text = text.replace(b"\r\n", b"\n").replace(b"\r", b"\n").replace(b"\n", b"\r\n")
+    if text and not text.endswith(b"\r\n"):
+        text += b"\r\n"
+    return text
+
+
+def crlf_stream(chunks):
+    r"""
+    Normalize line endings to ``\r\n`` for an iterable of bytes chunks.
+
+    Lines may span several chunks. The result is the same as ``crlf()`` applied to
+    the whole content.
+    """
+    pending = b""
+    for chunk in chunks:
+        data = pending + chunk
+        # Only complete lines are normalized. A trailing "\r" may be the first
+        # half of a "\r\n" line ending.
+        cut = max(data.rfind(b"\n"), data.rfind(b"\r", 0, len(data) - 1)) + 1
+        if cut:
+            yield crlf(data[:cut])
+        pending = data[cut:]
+    if pending:
+        yield crlf(pending)
+
+
+def crlf_text(text):
+    r"""
+    Normalize line endings to ``\r\n`` in a string.
+    """
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.replace("\n", "\r\n")
+
+
+def is_bytes(body):
     """
-    lines = text.splitlines()  # Will remove all types of linefeeds
-    lines = map(lambda x: x + b"\r\n", lines)  # append the "true" linefeed
-    return b"".join(lines)
+    Return True if the body is a plain bytes object (or None), not a stream.
+    """
+    return body is None or isinstance(body, (bytes, bytearray, memoryview))
 
 
 class Response:
@@ -31,6 +82,8 @@ class Response:
     """
 
     mimetype = "text/gemini; charset=utf-8"
+    # Set to True if the body line endings are already normalized
+    crlf_normalized = False
 
     @property
     def status(self):
@@ -46,9 +99,26 @@ class Response:
     def __body__(self):
         """
         Default Response body is None and will not be returned to the client.
+
+        The body can be either ``bytes``, or an iterator of ``bytes`` chunks. In the
+        latter case, the response is streamed to the client as the chunks are
+        produced.
         """
         return None
 
+    def encode(self, body):
+        """
+        Return the full response, composed of the META line and the body.
+        """
+        response = self.__meta__() + b"\r\n"
+        # Only non-empty bodies are sent
+        if body:
+            # Binary bodies should be returned as is.
+            if self.mimetype.startswith("text/") and not self.crlf_normalized:
+                body = crlf(body)
+            response += body
+        return response
+
     def __bytes__(self):
         """
         Return the response sent via the connection
@@ -57,28 +127,62 @@ class Response:
         if hasattr(self, "__bytes"):
             return getattr(self, "__bytes")
 
-        # Composed of the META line and the body
-        response = [self.__meta__(), self.__body__()]
-        # Only non-empty items are sent
-        response = filter(bool, response)
-        # Joining using the right linefeed separator
-        response = b"\r\n".join(response)
-
-        # Binary bodies should be returned as is.
-        if not self.mimetype.startswith("text/"):
-            setattr(self, "__bytes", response)
-            return response
-
-        response = crlf(response)
+        body = self.__body__()
+        if not is_bytes(body):
+            # Streamed body, gathered as a whole
+            body = b"".join(body)
+        response = self.encode(body)
         setattr(self, "__bytes", response)
         return response
 
     def __len__(self):
         """
         Return the length of the response
+
+        For a streamed response, it's the number of bytes produced so far.
         """
+        if hasattr(self, "__size"):
+            return getattr(self, "__size")
         return len(bytes(self))
 
+    def stream(self):
+        """
+        Iterate over the chunks of the response sent via the connection.
+
+        If the body is a ``bytes`` object, the whole response is sent at once.
+        If it's an iterator, the META line is sent right away, then each chunk as
+        soon as it's produced.
+
+        Responses overriding ``__bytes__`` are sent at once, as returned by it.
+        """
+        if hasattr(self, "__bytes"):
+            yield getattr(self, "__bytes")
+            return
+        if type(self).__bytes__ is not Response.__bytes__:
+            yield bytes(self)
+            return
+
+        body = self.__body__()
+        if is_bytes(body):
+            response = self.encode(body)
+            setattr(self, "__bytes", response)
+            yield response
+            return
+
+        meta = self.__meta__() + b"\r\n"
+        size = len(meta)
+        setattr(self, "__size", size)
+        yield meta
+        # Binary bodies should be returned as is.
+        if self.mimetype.startswith("text/") and not self.crlf_normalized:
+            body = crlf_stream(body)
+        for chunk in body:
+            if not chunk:
+                continue
+            size += len(chunk)
+            setattr(self, "__size", size)
+            yield chunk
+
 
 class SuccessResponse(Response):
     """
@@ -134,6 +238,23 @@ class PermanentRedirectResponse(RedirectResponse):
     status = 31
 
 
+class SlowDownResponse(Response):
+    """
+    Slow Down response. Status code: 44.
+
+    The client should wait for ``delay`` seconds before sending another request.
+    """
+
+    status = 44
+
+    def __init__(self, delay=1):
+        self.delay = delay
+
+    def __meta__(self):
+        meta = f"{self.status} {self.delay}"
+        return bytes(meta, encoding="utf-8")
+
+
 class PermanentFailureResponse(Response):
     """
     Permanent Failure response. Status code: 50.
@@ -221,7 +342,8 @@ class TextResponse(SuccessResponse):
             content.append(body)
         content = map(lambda x: x + "\r\n", content)
         content = "".join(content)
-        self.content = bytes(content, encoding="utf-8")
+        self.content = crlf(bytes(content, encoding="utf-8"))
+        self.crlf_normalized = True
 
     def __body__(self):
         return self.content
@@ -232,9 +354,15 @@ class DocumentResponse(SuccessResponse):
     Document response
 
     This reponse is the content a text document.
+
+    Documents bigger than ``STREAMING_MIN_SIZE`` are not loaded in memory: they're
+    streamed to the client, by chunks of ``CHUNK_SIZE`` bytes.
     """
 
-    def __init__(self, full_path, root_dir):
+    STREAMING_MIN_SIZE = 1024 * 1024
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, full_path, root_dir, info=None):
         """
         Open the document and read its content.
 
@@ -242,33 +370,55 @@ class DocumentResponse(SuccessResponse):
 
         * full_path: The full path for the file you want to read.
         * root_dir: The root directory of your static content tree. The full document path should belong to this directory.
+        * info: The ``PathInfo`` of the file, if it's already been resolved. The file size and mimetype are taken from it.
         """
         full_path = abspath(full_path)
         if not full_path.startswith(root_dir):
             raise FileNotFoundError("Forbidden path")
-        if not isfile(full_path):
-            raise FileNotFoundError
-        with open(full_path, "rb") as fd:
-            self.content = fd.read()
-        self.mimetype = self.guess_mimetype(full_path)
+        if info is None:
+            if not isfile(full_path):
+                raise FileNotFoundError
+            size = getsize(full_path)
+            mimetype = self.guess_mimetype(full_path)
+        else:
+            size, mimetype = info.size, info.mimetype
+        self.full_path = full_path
+        self.streaming = size >= self.STREAMING_MIN_SIZE
+        self.content = None
+        self.mimetype = mimetype
+        if not self.streaming:
+            with open(full_path, "rb") as fd:
+                self.content = fd.read()
+            # Text content is normalized once, when loaded.
+            if self.mimetype.startswith("text/"):
+                self.content = crlf(self.content)
+                self.crlf_normalized = True
 
     def guess_mimetype(self, filename):
         """
         Guess the mimetype of a file based on the file extension.
         """
-        mime, encoding = MIMETYPES.guess_type(filename)
-        if encoding:
-            return f"{mime}; charset={encoding}"
-        else:
-            return mime or "application/octet-stream"
+        return guess_mimetype(filename)
 
     def __meta__(self):
         meta = f"{self.status} {self.mimetype}"
         return bytes(meta, encoding="utf-8")
 
     def __body__(self):
+        if self.streaming:
+            return self.read_chunks()
         return self.content
 
+    def read_chunks(self):
+        """
+        Iterate over the document content, by chunks of ``CHUNK_SIZE`` bytes.
+        """
+        with open(self.full_path, "rb") as fd:
+            chunk = fd.read(self.CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = fd.read(self.CHUNK_SIZE)
+
 
 class DirectoryListingResponse(SuccessResponse):
     """
@@ -278,12 +428,13 @@ class DirectoryListingResponse(SuccessResponse):
     directory or if the path is not a sub-directory of the root path.
     """
 
-    def __init__(self, full_path, root_dir):
+    def __init__(self, full_path, root_dir, info=None):
         # Just in case
         full_path = abspath(full_path)
         if not full_path.startswith(root_dir):
             raise FileNotFoundError("Forbidden path")
-        if not isdir(full_path):
+        # The directory may have been resolved already (``PathInfo``)
+        if info is None and not isdir(full_path):
             raise FileNotFoundError
         relative_path = full_path[len(root_dir) :]
 
@@ -308,15 +459,14 @@ class TemplateResponse(SuccessResponse):
         """
         Leverage ``string.Template`` API to render dynamic Gemini content through a template file.
 
+        Templates are compiled once, and cached by the ``TEMPLATES`` registry.
+
         Arguments:
 
         * ``template_file``: full path to your template file.
         * ``context``: multiple variables to pass in your template as template variables.
         """
-        if not isfile(template_file):
-            raise TemplateError(f"Template file not found: `{template_file}`")
-        with open(template_file, "r") as fd:
-            self.template = Template(fd.read())
+        self.template = TEMPLATES.get(template_file)
         self.context = context
 
     def __body__(self):
@@ -325,3 +475,136 @@ class TemplateResponse(SuccessResponse):
             return bytes(body, encoding="utf-8")
         except KeyError as exc:
             raise TemplateError(exc.args[0])
+
+
+class CompiledTemplateResponse(SuccessResponse):
+    """
+    Template Response, using the Gemeaux template engine. Status code: 20.
+
+    Templates are compiled into Python functions, and rendered in a streaming way.
+    """
+
+    # Rendered text is sent by chunks of (at least) this size, in characters
+    CHUNK_SIZE = 8 * 1024
+    # Line endings are normalized while rendering
+    crlf_normalized = True
+
+    def __init__(self, template_file, **context):
+        """
+        Render dynamic Gemini content through a template file, supporting loops,
+        conditionals and includes.
+
+        The first chunk is rendered right away, so that template errors are raised
+        before the response is sent.
+
+        Arguments:
+
+        * ``template_file``: full path to your template file.
+        * ``context``: multiple variables to pass in your template as template variables.
+        """
+        self.template = COMPILED_TEMPLATES.get(template_file)
+        self.context = context
+        self.chunks = self.render_chunks()
+        self.first_chunk = next(self.chunks, None)
+
+    def __body__(self):
+        chunks, self.chunks = self.chunks, None
+        if chunks is None:
+            # Already sent once: rendered again
+            return self.render_chunks()
+        if self.first_chunk is None:
+            return None
+        return chain((self.first_chunk,), chunks)
+
+    def render_chunks(self):
+        """
+        Iterate over the rendered document, by chunks of (at least) ``CHUNK_SIZE``
+        characters, with normalized line endings.
+        """
+        buffer = []
+        size = 0
+        # A trailing "\r" may be the first half of a "\r\n" line ending
+        pending = ""
+        ends_with_newline = True
+        for text in self.template.render(self.context):
+            buffer.append(text)
+            size += len(text)
+            if size >= self.CHUNK_SIZE:
+                text = pending + "".join(buffer)
+                buffer = []
+                size = 0
+                pending = ""
+                if text.endswith("\r"):
+                    text, pending = text[:-1], "\r"
+                if text:
+                    text = crlf_text(text)
+                    ends_with_newline = text.endswith("\n")
+                    yield bytes(text, encoding="utf-8")
+        text = crlf_text(pending + "".join(buffer))
+        if text:
+            ends_with_newline = text.endswith("\n")
+        # The last line always ends with "\r\n", like with ``crlf()``
+        if not ends_with_newline:
+            text += "\r\n"
+        if text:
+            yield bytes(text, encoding="utf-8")
+
+
+class MetricsResponse(SuccessResponse):
+    """
+    Current values of the server metrics. Status code: 20.
+    """
+
+    FORMATS = {
+        "gemtext": "text/gemini; charset=utf-8",
+        "prometheus": "text/plain; version=0.0.4; charset=utf-8",
+    }
+
+    def __init__(self, metrics, format="gemtext"):
+        """
+        Arguments:
+
+        * ``metrics``: the ``Metrics`` registry.
+        * ``format``: either ``"gemtext"`` or ``"prometheus"``.
+        """
+        self.metrics = metrics
+        self.format = format
+        self.mimetype = self.FORMATS[format]
+
+    def __body__(self):
+        if self.format == "prometheus":
+            return bytes(self.metrics.render_prometheus(), encoding="utf-8")
+        return bytes(self.metrics.render_gemtext(), encoding="utf-8")
+
+
+class EncodedResponse(Response):
+    """
+    Response built from an already encoded payload (meta line and body).
+
+    Used for caching: the payload is returned as is, without any processing.
+    """
+
+    status = None
+
+    def __init__(self, payload, status, mimetype=None):
+        """
+        Arguments:
+
+        * ``payload``: the full response, as bytes.
+        * ``status``: the status code of the response.
+        * ``mimetype``: the mimetype of the response, if any.
+        """
+        self.payload = payload
+        self.status = status
+        if mimetype:
+            self.mimetype = mimetype
+
+    @classmethod
+    def from_response(cls, response):
+        """
+        Encode a response once and for all.
+        """
+        return cls(bytes(response), response.status, response.mimetype)
+
+    def __bytes__(self):
+        return self.payload
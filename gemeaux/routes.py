@@ -0,0 +1,46 @@
+"""
+Gemeaux url routing tools
+"""
+
+# Trie node key marking the end of a registered prefix. Can't collide with a
+# character of a path.
+END = None
+
+
+class PrefixTrie:
+    """
+    Character trie, used to find the longest registered prefix of a path.
+
+    Lookups only depend on the length of the path, not on the number of
+    registered prefixes.
+    """
+
+    def __init__(self, prefixes=None):
+        self.root = {}
+        for prefix in prefixes or []:
+            self.add(prefix)
+
+    def add(self, prefix):
+        """
+        Register a new prefix.
+        """
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[END] = prefix
+
+    def longest_prefix(self, path):
+        """
+        Return the longest registered prefix of ``path``, or None.
+
+        The empty prefix is never returned.
+        """
+        node = self.root
+        match = None
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if END in node:
+                match = node[END]
+        return match
@@ -0,0 +1,310 @@
+"""
+Gemeaux template tools
+"""
+import re
+from itertools import islice
+from os import fspath, stat
+from os.path import dirname, join
+from stat import S_ISREG
+from string import Template
+from threading import Lock
+
+from .exceptions import TemplateError
+
+
+class TemplateRegistry:
+    """
+    Registry of compiled templates.
+
+    Each template file is read and compiled once, and only reloaded when its
+    modification time changes.
+    """
+
+    def __init__(self, template_class=Template):
+        self.template_class = template_class
+        # Template path -> (modification time, compiled template)
+        self.templates = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template_file):
+        """
+        Return the compiled template for this file.
+
+        Raise a TemplateError if the file doesn't exist.
+        """
+        path = fspath(template_file)
+        try:
+            file_stat = stat(path)
+        except OSError:
+            file_stat = None
+        if not file_stat or not S_ISREG(file_stat.st_mode):
+            raise TemplateError(f"Template file not found: `{template_file}`")
+
+        cached = self.templates.get(path)
+        if cached and cached[0] == file_stat.st_mtime:
+            with self.lock:
+                self.hits += 1
+            return cached[1]
+
+        with open(path, "r") as fd:
+            template = self.compile(fd.read(), path)
+        with self.lock:
+            self.misses += 1
+            self.templates[path] = (file_stat.st_mtime, template)
+        return template
+
+    def compile(self, source, path):
+        """
+        Return the compiled template, from its source.
+        """
+        return self.template_class(source)
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+
+
+def lookup(value, attrs, name):
+    """
+    Resolve the ``attrs`` path on ``value``, using item or attribute access.
+    """
+    for attr in attrs:
+        try:
+            value = value[attr]
+        except (KeyError, IndexError, TypeError):
+            try:
+                value = getattr(value, attr)
+            except (AttributeError, TypeError):
+                raise TemplateError(name)
+    return value
+
+
+class CompiledTemplate:
+    """
+    Template compiled into a Python render function.
+
+    Syntax:
+
+    * ``{{ name }}`` or ``{{ name.attr }}``: variable, looked up in the context.
+    * ``{% for item in items %}…{% endfor %}``: loop.
+    * ``{% if [not] name %}…{% else %}…{% endif %}``: conditional.
+    * ``{% include "other.gmi" %}``: include another template file, relative to
+      the current one.
+
+    Block tags standing alone on their line don't leave an empty line.
+
+    Loops only made of text and variables are rendered by batches of
+    ``LOOP_BATCH`` items, each batch yielded as a single string.
+    """
+
+    LOOP_BATCH = 128
+
+    TOKEN_RE = re.compile(r"(\{\{.*?\}\}|\{%.*?%\})", re.DOTALL)
+    # Block tags alone on their line
+    STANDALONE_RE = re.compile(r"^[ \t]*(\{%[^\n]*?%\})[ \t]*(?:\r\n|\n|\Z)", re.M)
+    NAME_RE = re.compile(r"^[A-Za-z_]\w*(\.\w+)*$")
+    FOR_RE = re.compile(r"^for\s+([A-Za-z_]\w*)\s+in\s+(\S+)$")
+    IF_RE = re.compile(r"^if\s+(not\s+)?(\S+)$")
+    INCLUDE_RE = re.compile(r"""^include\s+(["'])(.+)\1$""")
+
+    def __init__(self, source, path=None, registry=None):
+        self.path = path
+        self.registry = registry
+        code = self.generate(source)
+        namespace = {
+            "lookup": lookup,
+            "include": self.include,
+            "islice": islice,
+            "LOOP_BATCH": self.LOOP_BATCH,
+        }
+        exec(compile(code, f"<template {path}>", "exec"), namespace)
+        self.render_function = namespace["render"]
+
+    def generate(self, source):
+        """
+        Return the source code of the ``render(context)`` generator function.
+        """
+        source = self.STANDALONE_RE.sub(r"\1", source)
+        lines = ["def render(context):", "    if False:", "        yield"]
+        # Loop variables in scope: template name -> Python name
+        scopes = [{}]
+        # Opened blocks, to check their closing
+        blocks = []
+        # Opened loops: (index of their first line, Python name, iterable)
+        loops = []
+
+        # Text and variables waiting to be yielded, as f-string literals
+        pending = []
+        # Same, with direct item access for the variables: yielded expression ->
+        # fast expression
+        fast_expressions = {}
+        fast_pending = []
+
+        def emit(line):
+            flush()
+            lines.append("    " * len(scopes) + line)
+
+        def flush():
+            # Adjacent f-string literals are joined into one at compile time.
+            if pending:
+                joined = " ".join(pending)
+                fast_expressions[joined] = " ".join(fast_pending)
+                lines.append("    " * len(scopes) + "yield " + joined)
+                pending.clear()
+                fast_pending.clear()
+
+        def batch_loop(start, python_name, iterable):
+            # A loop body only made of text and variables is a single yield
+            body = [line.strip() for line in lines[start + 1 :]]
+            if len(body) != 2 or body[1].startswith("yield from "):
+                return
+            indent = "    " * len(scopes)
+            items, batch, text = f"i{start}", f"b{start}", f"t{start}"
+            safe = body[1][len("yield ") :]
+            fast = fast_expressions[safe]
+            lines[start:] = [
+                f"{indent}{items} = iter({iterable})",
+                f"{indent}while True:",
+                f"{indent}    {batch} = list(islice({items}, LOOP_BATCH))",
+                f"{indent}    if not {batch}:",
+                f"{indent}        break",
+            ]
+            if fast == safe:
+                lines.append(
+                    f'{indent}    yield "".join([{safe} for {python_name} in {batch}])'
+                )
+                return
+            # Direct item access first, the lookups raise the proper errors
+            lines.extend(
+                [
+                    f"{indent}    try:",
+                    f'{indent}        {text} = "".join([{fast} for {python_name} in {batch}])',
+                    f"{indent}    except (KeyError, IndexError, TypeError):",
+                    f'{indent}        {text} = "".join([{safe} for {python_name} in {batch}])',
+                    f"{indent}    yield {text}",
+                ]
+            )
+
+        def expression(name, fast=False):
+            """
+            Return the Python expression of a variable.
+
+            The ``fast`` one uses item access for the context variables and the
+            attributes of the loop variables, without falling back to attributes.
+            """
+            if not self.NAME_RE.match(name):
+                raise TemplateError(f"Invalid variable name: `{name}`")
+            base, *attrs = name.split(".")
+            for scope in reversed(scopes):
+                if base in scope:
+                    value = scope[base]
+                    break
+            else:
+                value, attrs = "context", [base] + attrs
+            if not attrs:
+                return value
+            # Numeric parts are sequence indexes
+            attrs = tuple(int(attr) if attr.isdigit() else attr for attr in attrs)
+            if fast and len(attrs) == 1 and isinstance(attrs[0], str):
+                return f"{value}[{attrs[0]!r}]"
+            return f"lookup({value}, {attrs!r}, {name!r})"
+
+        for token in self.TOKEN_RE.split(source):
+            if not token:
+                continue
+            if token.startswith("{{"):
+                name = token[2:-2].strip()
+                pending.append(f'f"{{{expression(name)}}}"')
+                fast_pending.append(f'f"{{{expression(name, fast=True)}}}"')
+            elif token.startswith("{%"):
+                tag = token[2:-2].strip()
+                match_for = self.FOR_RE.match(tag)
+                match_if = self.IF_RE.match(tag)
+                match_include = self.INCLUDE_RE.match(tag)
+                if match_for:
+                    variable, name = match_for.groups()
+                    python_name = f"v{len(lines)}"
+                    iterable = expression(name)
+                    flush()
+                    loops.append((len(lines), python_name, iterable))
+                    emit(f"for {python_name} in {iterable}:")
+                    scopes.append({variable: python_name})
+                    emit("pass")
+                    blocks.append("for")
+                elif match_if:
+                    negation, name = match_if.groups()
+                    emit(f"if {'not ' if negation else ''}{expression(name)}:")
+                    scopes.append({})
+                    emit("pass")
+                    blocks.append("if")
+                elif tag == "else":
+                    if not blocks or blocks[-1] != "if":
+                        raise TemplateError("Unexpected `else` tag")
+                    flush()
+                    scopes.pop()
+                    emit("else:")
+                    scopes.append({})
+                    emit("pass")
+                    blocks[-1] = "else"
+                elif tag in ("endfor", "endif"):
+                    expected = ("for",) if tag == "endfor" else ("if", "else")
+                    if not blocks or blocks.pop() not in expected:
+                        raise TemplateError(f"Unexpected `{tag}` tag")
+                    flush()
+                    scopes.pop()
+                    if tag == "endfor":
+                        batch_loop(*loops.pop())
+                elif match_include:
+                    # Included templates see the loop variables too.
+                    variables = {}
+                    for scope in scopes:
+                        variables.update(scope)
+                    variables = ", ".join(f"{k!r}: {v}" for k, v in variables.items())
+                    emit(
+                        f"yield from include({match_include.group(2)!r}, "
+                        f"{{**context, {variables}}})"
+                    )
+                else:
+                    raise TemplateError(f"Unknown tag: `{tag}`")
+            else:
+                escaped = token.replace("{", "{{").replace("}", "}}")
+                pending.append(f"f{escaped!r}")
+                fast_pending.append(f"f{escaped!r}")
+        flush()
+        if blocks:
+            raise TemplateError(f"Unclosed `{blocks[-1]}` tag")
+        return "\n".join(lines)
+
+    def include(self, template_file, context):
+        """
+        Render another template file, relative to the current one.
+        """
+        if self.path:
+            template_file = join(dirname(self.path), template_file)
+        registry = self.registry or COMPILED_TEMPLATES
+        yield from registry.get(template_file).render(context)
+
+    def render(self, context):
+        """
+        Iterate over the rendered chunks of text.
+        """
+        return self.render_function(context)
+
+
+class CompiledTemplateRegistry(TemplateRegistry):
+    """
+    Registry of templates compiled into Python render functions.
+    """
+
+    def __init__(self):
+        super().__init__(CompiledTemplate)
+
+    def compile(self, source, path):
+        return CompiledTemplate(source, path, self)
+
+
+# Process-wide template registries
+TEMPLATES = TemplateRegistry()
+COMPILED_TEMPLATES = CompiledTemplateRegistry()
@@ -0,0 +1,35 @@
+import json
+import shutil
+
+import pytest
+
+from gemeaux.bench import main, make_site, percentile
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([3], 99) == 3
+    assert percentile([], 50) is None
+
+
+def test_make_site(tmpdir):
+    static_dir, template_file = make_site(str(tmpdir))
+    assert tmpdir.join("static", "index.gmi").exists()
+    assert len(tmpdir.join("static", "listing").listdir()) == 100
+    assert tmpdir.join("template.txt").read() == "# $title\n\n$body\n"
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is missing")
+def test_bench(capsys):
+    main(["--duration", "0.2", "--concurrency", "2", "--routes", "static", "error"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["engine"] == "threads"
+    assert set(report["routes"]) == {"static", "error"}
+    for result in report["routes"].values():
+        assert result["requests"] > 0
+        assert result["errors"] == 0
+        assert result["latency_ms"]["p50"] <= result["latency_ms"]["p99"]
@@ -0,0 +1,171 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from gemeaux.cache import LRUCache, ResponseCache
+
+
+def test_lru_cache():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "A", 4)
+    cache.set("b", "B", 4)
+    assert cache.get("a") == "A"
+    assert cache.get("b") == "B"
+    assert cache.get("c") is None
+    assert cache.get("c", "default") == "default"
+    assert len(cache) == 2
+    assert cache.size == 8
+
+
+def test_lru_cache_eviction():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "A", 4)
+    cache.set("b", "B", 4)
+    # "a" is now the most recently used
+    cache.get("a")
+    cache.set("c", "C", 4)
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.size == 8
+
+
+def test_lru_cache_too_big():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "A", 11)
+    assert "a" not in cache
+    assert cache.size == 0
+
+
+def test_lru_cache_replace_delete():
+    cache = LRUCache(max_size=10)
+    cache.set("a", "A", 4)
+    cache.set("a", "AA", 8)
+    assert cache.get("a") == "AA"
+    assert cache.size == 8
+    cache.delete("a")
+    cache.delete("not-here")
+    assert "a" not in cache
+    assert cache.size == 0
+
+
+def test_response_cache_fresh():
+    cache = ResponseCache(ttl=60)
+    renders = []
+
+    def render():
+        renders.append(1)
+        return len(renders)
+
+    assert cache.get("key", render) == 1
+    assert cache.get("key", render) == 1
+    assert cache.get("other", render) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_response_cache_stale_while_revalidate():
+    cache = ResponseCache(ttl=60, stale_ttl=60)
+    cache.get("key", lambda: "old")
+    # Make the entry stale
+    cache.entries.set("key", ("old", time.monotonic() - 90))
+    refreshed = threading.Event()
+
+    def render():
+        refreshed.set()
+        return "new"
+
+    # The stale value is returned, and refreshed in the background
+    assert cache.get("key", render) == "old"
+    assert refreshed.wait(5)
+    for _ in range(100):
+        if "key" not in cache.renders:
+            break
+        time.sleep(0.01)
+    assert cache.get("key", render) == "new"
+    assert cache.stale_hits == 1
+
+
+def test_response_cache_single_refresh():
+    cache = ResponseCache(ttl=60, stale_ttl=60)
+    cache.get("key", lambda: "old")
+    cache.entries.set("key", ("old", time.monotonic() - 90))
+    # The refresh threads never run: the first one is still in progress
+    with patch("gemeaux.cache.Thread") as mock_thread:
+        for _ in range(5):
+            assert cache.get("key", lambda: "new") == "old"
+    assert mock_thread.call_count == 1
+    assert cache.stale_hits == 5
+    assert "key" in cache.renders
+
+
+def test_response_cache_refresh_error():
+    log = Mock()
+    cache = ResponseCache(ttl=60, stale_ttl=60, log=log)
+    cache.get("key", lambda: "old")
+    cache.entries.set("key", ("old", time.monotonic() - 90))
+
+    def render():
+        raise FileNotFoundError("Path not found")
+
+    with patch("gemeaux.cache.Thread") as mock_thread:
+        assert cache.get("key", render) == "old"
+    # Run the refresh in the current thread
+    _, kwargs = mock_thread.call_args
+    kwargs["target"](*kwargs["args"])
+    assert cache.refresh_errors == 1
+    log.assert_called_once_with(
+        "Error: failed to refresh the cached response 'key': "
+        "FileNotFoundError('Path not found')"
+    )
+    # The stale value is kept, and can be refreshed again
+    assert cache.renders == {}
+    assert cache.get("key", render) == "old"
+
+
+def test_response_cache_expired():
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    cache.get("key", lambda: "old")
+    cache.entries.set("key", ("old", time.monotonic() - 61))
+    assert cache.get("key", lambda: "new") == "new"
+
+
+def test_response_cache_coalescing():
+    cache = ResponseCache(ttl=60)
+    started = threading.Event()
+    release = threading.Event()
+    renders = []
+
+    def render():
+        renders.append(1)
+        started.set()
+        release.wait(5)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get("key", render)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ["value"] * 5
+    assert len(renders) == 1
+
+
+def test_response_cache_error():
+    cache = ResponseCache(ttl=60)
+
+    def render():
+        raise FileNotFoundError("Path not found")
+
+    with pytest.raises(FileNotFoundError):
+        cache.get("key", render)
+    assert "key" not in cache.entries
+    assert cache.renders == {}
@@ -21,3 +21,126 @@ def test_args_config():
     assert config.certfile == "cert.pem"
     assert config.keyfile == "key.pem"
     assert config.nb_connections == 5
+
+
+def test_engine_config():
+    assert ZeroConfig().engine == "sync"
+
+    with patch("sys.argv", ["prog"]):
+        config = ArgsConfig()
+    assert config.engine == "sync"
+
+    with patch("sys.argv", ["prog", "--engine", "asyncio"]):
+        config = ArgsConfig()
+    assert config.engine == "asyncio"
+
+
+def test_workers_config():
+    assert ZeroConfig().workers == 10
+
+    with patch("sys.argv", ["prog", "--engine", "threads", "--workers", "4"]):
+        config = ArgsConfig()
+    assert config.engine == "threads"
+    assert config.workers == 4
+
+
+def test_processes_config():
+    assert ZeroConfig().processes == 1
+
+    with patch("sys.argv", ["prog", "--processes", "4"]):
+        config = ArgsConfig()
+    assert config.processes == 4
+
+
+def test_handshake_timeout_config():
+    assert ZeroConfig().handshake_timeout == 5
+
+    with patch("sys.argv", ["prog", "--handshake-timeout", "0.5"]):
+        config = ArgsConfig()
+    assert config.handshake_timeout == 0.5
+
+
+def test_request_timeout_config():
+    assert ZeroConfig().request_timeout == 5
+
+    with patch("sys.argv", ["prog", "--request-timeout", "2"]):
+        config = ArgsConfig()
+    assert config.request_timeout == 2
+
+
+def test_tls_config():
+    config = ZeroConfig()
+    assert config.session_tickets
+    assert config.ecdh_curve is None
+    assert config.ciphers is None
+
+    testargs = [
+        "prog",
+        "--no-session-tickets",
+        "--ecdh-curve",
+        "prime256v1",
+        "--ciphers",
+        "ECDHE+AESGCM",
+    ]
+    with patch("sys.argv", testargs):
+        config = ArgsConfig()
+    assert not config.session_tickets
+    assert config.ecdh_curve == "prime256v1"
+    assert config.ciphers == "ECDHE+AESGCM"
+
+
+def test_log_config():
+    config = ZeroConfig()
+    assert config.log_file is None
+    assert config.log_sample_rate == 1
+
+    argv = ["prog", "--log-file", "access.log", "--log-max-bytes", "1000"]
+    argv += ["--log-backups", "2", "--log-sample-rate", "0.1"]
+    argv += ["--log-max-pending", "100"]
+    with patch("sys.argv", argv):
+        config = ArgsConfig()
+    assert config.log_file == "access.log"
+    assert config.log_max_bytes == 1000
+    assert config.log_backups == 2
+    assert config.log_sample_rate == 0.1
+    assert config.log_max_pending == 100
+
+
+def test_timings_config():
+    assert ZeroConfig().timings is False
+    assert ZeroConfig().log_timings is False
+
+    with patch("sys.argv", ["prog", "--timings", "--log-timings"]):
+        config = ArgsConfig()
+    assert config.timings is True
+    assert config.log_timings is True
+
+
+def test_admission_config():
+    config = ZeroConfig()
+    assert config.max_in_flight == 0
+    assert config.max_queue_delay == 0
+    assert config.slow_down_delay == 1
+
+    argv = ["prog", "--max-in-flight", "100", "--max-queue-delay", "0.5"]
+    argv += ["--slow-down-delay", "5"]
+    with patch("sys.argv", argv):
+        config = ArgsConfig()
+    assert config.max_in_flight == 100
+    assert config.max_queue_delay == 0.5
+    assert config.slow_down_delay == 5
+
+
+def test_client_limits_config():
+    config = ZeroConfig()
+    assert config.client_rate == 0
+    assert config.client_burst == 10
+    assert config.client_max_connections == 0
+
+    argv = ["prog", "--client-rate", "0.5", "--client-burst", "5"]
+    argv += ["--client-max-connections", "3"]
+    with patch("sys.argv", argv):
+        config = ArgsConfig()
+    assert config.client_rate == 0.5
+    assert config.client_burst == 5
+    assert config.client_max_connections == 3
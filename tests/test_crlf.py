@@ -1,4 +1,5 @@
 from gemeaux import crlf
+from gemeaux.responses import crlf_stream
 
 
 def test_crlf(multi_line_content, multi_line_content_crlf):
@@ -11,3 +12,24 @@ def test_crlf_several_lf():
     content = bytes("line\n\n\nlast line", encoding="utf-8")
     content_expected = bytes("line\r\n\r\n\r\nlast line\r\n", encoding="utf-8")
     assert crlf(content) == content_expected
+
+
+def test_crlf_stream():
+    content = b"line\r\n\r\nsecond\rthird\n\nfourth\r\n\rlast line"
+    expected = crlf(content)
+    # Every chunk size, including cuts between "\r" and "\n"
+    for size in range(1, len(content) + 1):
+        chunks = [content[i : i + size] for i in range(0, len(content), size)]
+        assert b"".join(crlf_stream(chunks)) == expected
+
+
+def test_crlf_stream_empty():
+    assert b"".join(crlf_stream([])) == b""
+    assert b"".join(crlf_stream([b"", b""])) == b""
+
+
+def test_crlf_splitlines_equivalent():
+    # Same result as splitting lines and joining them with CRLF
+    for content in (b"", b"\r", b"\n", b"\r\n", b"\n\r", b"a\r\rb", b"a\r\n\nb\r"):
+        expected = b"".join(line + b"\r\n" for line in content.splitlines())
+        assert crlf(content) == expected
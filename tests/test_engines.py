@@ -0,0 +1,558 @@
+import asyncio
+import shutil
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from gemeaux import (
+    App,
+    EncodedResponse,
+    ImproperlyConfigured,
+    Metrics,
+    SuccessResponse,
+    TextResponse,
+    TimeoutException,
+    Timing,
+    ZeroConfig,
+)
+from gemeaux.bench import make_certificate
+
+
+class FakeReader:
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+
+class FakeWriter:
+    def __init__(self):
+        self.written = b""
+        self.closed = False
+
+    def get_extra_info(self, name):
+        if name == "peername":
+            return ("127.0.0.1", 12345)
+        return None
+
+    def write(self, data):
+        self.written += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, data):
+        self.data = data
+        self.sent = b""
+        self.closed = False
+
+    def recv(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        self.sent += data
+
+    def close(self):
+        self.closed = True
+
+
+def serve(app, data):
+    reader, writer = FakeReader(data), FakeWriter()
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app.handle_stream(reader, writer))
+    finally:
+        loop.close()
+    return writer
+
+
+@pytest.fixture
+def app():
+    app = App(urls={"": TextResponse(body="Hello")}, config=ZeroConfig())
+    app.port = 1965
+    return app
+
+
+@patch("gemeaux.App.log")
+def test_handle_stream(mock_log, app):
+    writer = serve(app, b"gemini://localhost/\r\n")
+    assert writer.written == b"20 text/gemini; charset=utf-8\r\nHello\r\n"
+    assert writer.closed
+    # Access log
+    assert mock_log.call_count == 1
+
+
+@patch("gemeaux.App.log")
+def test_handle_stream_errors(mock_log, app):
+    writer = serve(app, b"https://localhost/\r\n")
+    assert writer.written == b"53 PROXY REQUEST REFUSED\r\n"
+    assert writer.closed
+
+    writer = serve(app, b"localhost/\r\n")
+    assert writer.written == b"59 BAD REQUEST\r\n"
+
+    # No CRLF, no response
+    writer = serve(app, b"gemini://localhost/")
+    assert writer.written == b""
+    assert writer.closed
+
+
+@patch("gemeaux.App.log")
+def test_handle_request(mock_log, app):
+    connection = FakeConnection(b"gemini://localhost/\r\n")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b"20 text/gemini; charset=utf-8\r\nHello\r\n"
+    assert connection.closed
+    assert mock_log.call_count == 1
+
+    connection = FakeConnection(b"https://localhost/\r\n")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b"53 PROXY REQUEST REFUSED\r\n"
+    assert connection.closed
+
+
+def test_handshake_timeout(app):
+    app.config.handshake_timeout = 0.05
+    app.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server, client = socket.socketpair()
+    with client:
+        # The client never sends its "hello"
+        assert app.handshake(server) is None
+    assert app.aborted_handshakes == 1
+
+
+def test_handshake_error(app):
+    app.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server, client = socket.socketpair()
+    with client:
+        client.sendall(b"gemini://localhost/\r\n")
+        assert app.handshake(server) is None
+    assert app.aborted_handshakes == 1
+
+
+class ChunkedResponse(SuccessResponse):
+    def stream(self):
+        yield b"20 text/gemini\r\n"
+        yield b"Hello\r\n"
+        yield b"World\r\n"
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_request_stream(mock_log_access):
+    response = ChunkedResponse()
+    app = App(urls={"": response}, config=ZeroConfig())
+    app.port = 1965
+    connection = FakeConnection(b"gemini://localhost/\r\n")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b"20 text/gemini\r\nHello\r\nWorld\r\n"
+    mock_log_access.assert_called_once_with(
+        "127.0.0.1", "gemini://localhost/", response, 30
+    )
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_request_encoded_response(mock_log_access):
+    response = EncodedResponse.from_response(TextResponse(body="Hello"))
+    app = App(urls={"": response}, config=ZeroConfig())
+    app.port = 1965
+    connection = FakeConnection(b"gemini://localhost/\r\n")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b"20 text/gemini; charset=utf-8\r\nHello\r\n"
+
+
+class FakeTLS:
+    def __init__(self, session_reused):
+        self.session_reused = session_reused
+
+
+def test_count_handshake(app):
+    app.metrics = Metrics()
+    app.count_handshake(FakeTLS(session_reused=False))
+    app.count_handshake(FakeTLS(session_reused=True))
+    app.count_handshake(FakeTLS(session_reused=True))
+    assert app.full_handshakes == 1
+    assert app.resumed_handshakes == 2
+    assert app.metrics.counters == {"full_handshakes": 1, "resumed_handshakes": 2}
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_ssl_context(mock_load_cert_chain, app):
+    context = app.get_ssl_context()
+    assert not context.options & ssl.OP_NO_TICKET
+
+    app.config.session_tickets = False
+    app.config.ecdh_curve = "prime256v1"
+    app.config.ciphers = "ECDHE+AESGCM"
+    context = app.get_ssl_context()
+    assert context.options & ssl.OP_NO_TICKET
+    assert context.options & ssl.OP_CIPHER_SERVER_PREFERENCE
+    ciphers = [cipher["name"] for cipher in context.get_ciphers()]
+    assert "ECDHE-RSA-AES256-GCM-SHA384" in ciphers
+    assert "ECDHE-RSA-CHACHA20-POLY1305" not in ciphers
+
+
+def test_run_unknown_engine(app):
+    with pytest.raises(ImproperlyConfigured):
+        app.run(engine="unknown")
+
+
+def test_run_no_processes(app):
+    app.config.processes = 0
+    with pytest.raises(ImproperlyConfigured):
+        app.run()
+
+
+class TricklingConnection(FakeConnection):
+    """
+    Connection receiving its data a few bytes at a time.
+    """
+
+    def recv(self, size):
+        return super().recv(min(size, 3))
+
+
+@patch("gemeaux.App.log_access")
+def test_read_request_split(mock_log_access, app):
+    connection = TricklingConnection(b"gemini://localhost/\r\n")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent.startswith(b"20 text/gemini")
+    assert app.dropped_requests == 0
+    assert connection.timeout is None
+
+
+def test_read_request_too_long(app):
+    connection = FakeConnection(b"gemini://localhost/" + b"0" * 2000)
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b"59 BAD REQUEST\r\n"
+    assert app.dropped_requests == 1
+
+
+@patch("gemeaux.App.log")
+def test_read_request_closed(mock_log, app):
+    # The client closes the connection before sending its CRLF
+    connection = FakeConnection(b"gemini://localhost/")
+    app.handle_request(connection, "127.0.0.1")
+    assert connection.sent == b""
+    assert app.dropped_requests == 1
+
+
+@patch("gemeaux.App.log")
+def test_read_request_deadline(mock_log, app):
+    app.config.request_timeout = 0.2
+    server, client = socket.socketpair()
+    try:
+        client.sendall(b"gemini://")
+        with pytest.raises(TimeoutException):
+            app.read_request(server)
+    finally:
+        server.close()
+        client.close()
+    assert app.dropped_requests == 1
+
+
+@patch("gemeaux.App.log_access")
+def test_read_stream_request(mock_log_access, app):
+    writer = serve(app, b"gemini://localhost/\r\nextra data")
+    assert writer.written.startswith(b"20 text/gemini")
+    writer = serve(app, b"gemini://localhost/" + b"0" * 2000)
+    assert writer.written == b"59 BAD REQUEST\r\n"
+    assert app.dropped_requests == 1
+
+
+@patch("gemeaux.App.log")
+def test_read_stream_request_deadline(mock_log, app):
+    app.config.request_timeout = 0.2
+
+    class SlowReader:
+        async def read(self, size):
+            await asyncio.sleep(10)
+
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(TimeoutException):
+            loop.run_until_complete(app.read_stream_request(SlowReader()))
+    finally:
+        loop.close()
+    assert app.dropped_requests == 1
+
+
+@patch("gemeaux.App.log")
+@patch("gemeaux.App.log_access")
+def test_handle_request_metrics(mock_log_access, mock_log):
+    metrics = Metrics()
+    app = App(
+        urls={"/hello": TextResponse(body="Hello")},
+        config=ZeroConfig(),
+        metrics=metrics,
+    )
+    app.port = 1965
+    app.handle_request(FakeConnection(b"gemini://localhost/hello\r\n"), "127.0.0.1")
+    app.handle_request(FakeConnection(b"gemini://localhost/other\r\n"), "127.0.0.1")
+    app.handle_request(FakeConnection(b"https://localhost/\r\n"), "127.0.0.1")
+    app.handle_request(FakeConnection(b"gemini://localhost/"), "127.0.0.1")
+    assert metrics.requests == {("/hello", 20): 1, ("-", 51): 1, ("-", 53): 1}
+    assert metrics.durations["-"].count == 2
+    hello, not_found = (
+        b"20 text/gemini; charset=utf-8\r\nHello\r\n",
+        b"51 Route Not Found\r\n",
+    )
+    assert metrics.bytes_sent == len(hello) + len(not_found) + len(
+        b"53 PROXY REQUEST REFUSED\r\n"
+    )
+    assert metrics.exceptions == {
+        "ProxyRequestRefusedException": 1,
+        "TimeoutException": 1,
+    }
+    assert metrics.counters == {"dropped_requests": 1}
+
+    writer = serve(app, b"gemini://localhost/hello\r\n")
+    assert writer.written == hello
+    assert metrics.requests[("/hello", 20)] == 2
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_connection_timing_hook(mock_log_access, app):
+    app.metrics = Metrics()
+    timings = []
+    app.add_timing_hook(lambda request, response, timing: timings.append(timing))
+    connection = FakeConnection(b"gemini://localhost/\r\n")
+    with patch.object(app, "handshake", return_value=connection):
+        app.handle_connection(connection, "127.0.0.1", time.monotonic())
+    assert len(timings) == 1
+    timing = timings[0]
+    phases = [getattr(timing, phase) for phase in Timing.PHASES]
+    assert all(duration >= 0 for duration in phases)
+    assert timing.mark - timing.started == pytest.approx(sum(phases))
+    assert app.metrics.phases["send"].count == 1
+    # Timings are not logged by default
+    mock_log_access.assert_called_with(
+        "127.0.0.1", "gemini://localhost/", app.urls[""], 38
+    )
+
+
+@patch("gemeaux.App.log")
+def test_handle_request_log_timings(mock_log, app):
+    app.config.log_timings = True
+    app.timings = True
+    app.metrics = Metrics()
+    app.handle_request(
+        FakeConnection(b"gemini://localhost/\r\n"), "127.0.0.1", Timing()
+    )
+    message = mock_log.call_args[0][0]
+    assert '"gemini://localhost/" text/gemini 20 38 accept=' in message
+    assert " send=" in message
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_connection_queue_delay(mock_log_access, app):
+    app.metrics = Metrics()
+    app.config.max_queue_delay = 0.5
+    connection = FakeConnection(b"gemini://localhost/\r\n")
+    with patch.object(app, "handshake", side_effect=lambda connection: connection):
+        # Served
+        app.handle_connection(connection, "127.0.0.1", time.monotonic())
+        assert connection.sent.startswith(b"20 ")
+        # Waited too long for a worker
+        connection = FakeConnection(b"gemini://localhost/\r\n")
+        app.handle_connection(connection, "127.0.0.1", time.monotonic() - 1)
+    assert connection.sent == b"44 1\r\n"
+    assert connection.closed
+    # The request has been read anyway
+    assert connection.data == b""
+    assert app.rejected_requests == 1
+    assert app.metrics.counters["rejected_requests"] == 1
+    assert app.metrics.requests[("-", 44)] == 1
+    mock_log_access.assert_called_with("127.0.0.1", "", app.slow_down_response, 6)
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_stream_max_in_flight(mock_log_access, app):
+    app.metrics = Metrics()
+    app.config.max_in_flight = 1
+    writer = serve(app, b"gemini://localhost/\r\n")
+    assert writer.written.startswith(b"20 ")
+    assert app.in_flight == 0
+    # Another connection is being served
+    app.in_flight = 1
+    writer = serve(app, b"gemini://localhost/\r\n")
+    assert writer.written == b"44 1\r\n"
+    assert writer.closed
+    assert app.in_flight == 1
+    assert app.rejected_requests == 1
+    assert app.metrics.requests[("-", 44)] == 1
+
+
+def test_slow_down_delay():
+    class Config(ZeroConfig):
+        slow_down_delay = 10
+
+    app = App(urls={"": TextResponse(body="Hello")}, config=Config())
+    assert bytes(app.slow_down_response) == b"44 10\r\n"
+
+
+class FakeServer:
+    def __init__(self, connections):
+        self.connections = list(connections)
+
+    def accept(self):
+        if not self.connections:
+            raise KeyboardInterrupt
+        return self.connections.pop(0)
+
+
+@patch("gemeaux.App.log_access")
+def test_mainloop_rate_limit(mock_log_access):
+    class Config(ZeroConfig):
+        client_rate = 0.1
+        client_burst = 2
+
+    app = App(urls={"": TextResponse(body="Hello")}, config=Config())
+    app.port = 1965
+    app.metrics = Metrics()
+    connections = [FakeConnection(b"gemini://localhost/\r\n") for _ in range(4)]
+    server = FakeServer(
+        [
+            (connections[0], ("1.2.3.4", 1000)),
+            (connections[1], ("1.2.3.4", 1001)),
+            (connections[2], ("1.2.3.4", 1002)),
+            (connections[3], ("5.6.7.8", 1000)),
+        ]
+    )
+    with patch.object(app, "handshake", side_effect=lambda connection: connection):
+        # The workers are done when leaving the ``with`` block
+        with ThreadPoolExecutor(1) as executor, ThreadPoolExecutor(1) as rejector:
+            with pytest.raises(SystemExit), patch("builtins.print"):
+                app.mainloop(server, executor, rejector)
+    assert [connection.sent[:2] for connection in connections] == [
+        b"20",
+        b"20",
+        b"44",
+        b"20",
+    ]
+    # One token every 10 seconds
+    assert connections[2].sent == b"44 10\r\n"
+    assert app.rate_limited_requests == 1
+    assert app.rejected_requests == 0
+    assert app.metrics.counters == {"rate_limited_requests": 1}
+    # The connections have been released
+    assert all(state.connections == 0 for state in app.rate_limiter.clients.values())
+
+
+def start_sync_server(tmpdir, config_class):
+    """
+    Serve an app with the sync engine, in a background thread. Return its port.
+    """
+    certfile, keyfile = make_certificate(str(tmpdir))
+
+    class Config(config_class):
+        pass
+
+    Config.certfile, Config.keyfile = certfile, keyfile
+    app = App(urls={"": TextResponse(body="Hello")}, config=Config())
+    app.context = app.get_ssl_context()
+    app.port = 1965
+    server = socket.socket()
+    server.bind(("localhost", 0))
+    server.listen(5)
+    thread = threading.Thread(target=app.mainloop, args=(server,), daemon=True)
+    thread.start()
+    return app, server.getsockname()[1]
+
+
+def fetch(port):
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    with socket.create_connection(("localhost", port), timeout=5) as connection:
+        with context.wrap_socket(connection, server_hostname="localhost") as tls:
+            tls.sendall(b"gemini://localhost/\r\n")
+            data = b""
+            while True:
+                chunk = tls.recv(4096)
+                if not chunk:
+                    return data
+                data += chunk
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is missing")
+@patch("gemeaux.App.log_access")
+def test_serve_sync_pending_handshake(mock_log_access, tmpdir):
+    class Config(ZeroConfig):
+        handshake_timeout = 1
+
+    app, port = start_sync_server(tmpdir, Config)
+    # Connected, but never starting its handshake
+    idle = socket.create_connection(("localhost", port))
+    try:
+        started = time.monotonic()
+        assert fetch(port).startswith(b"20 ")
+        # Served without waiting for the idle connection
+        assert time.monotonic() - started < Config.handshake_timeout
+        # The idle connection is dropped after the handshake timeout
+        idle.settimeout(5)
+        assert idle.recv(1024) == b""
+    finally:
+        idle.close()
+    assert app.aborted_handshakes == 1
+    assert app.full_handshakes == 1
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="openssl is missing")
+@patch("gemeaux.App.log_access")
+def test_serve_sync_rate_limit(mock_log_access, tmpdir):
+    class Config(ZeroConfig):
+        client_rate = 0.1
+        client_burst = 1
+
+    app, port = start_sync_server(tmpdir, Config)
+    assert fetch(port).startswith(b"20 ")
+    assert fetch(port) == b"44 10\r\n"
+    # Counted after the connection is closed
+    wait_for(lambda: app.rate_limited_requests == 1)
+    wait_for(
+        lambda: all(
+            state.connections == 0 for state in app.rate_limiter.clients.values()
+        )
+    )
+
+
+@patch("gemeaux.App.log_access")
+def test_handle_stream_rate_limit(mock_log_access):
+    class Config(ZeroConfig):
+        client_max_connections = 1
+
+    app = App(urls={"": TextResponse(body="Hello")}, config=Config())
+    app.port = 1965
+    app.metrics = Metrics()
+    writer = serve(app, b"gemini://localhost/\r\n")
+    assert writer.written.startswith(b"20 ")
+    # The client has another open connection
+    app.rate_limiter.acquire("127.0.0.1")
+    writer = serve(app, b"gemini://localhost/\r\n")
+    assert writer.written == b"44 1\r\n"
+    assert app.rate_limited_requests == 1
+    app.rate_limiter.release("127.0.0.1")
+    assert len(app.rate_limiter) == 0
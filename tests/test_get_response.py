@@ -1,10 +1,21 @@
 from unittest.mock import patch
 
-from gemeaux import App, NotFoundResponse, ZeroConfig
+from gemeaux import (
+    App,
+    BadRequestException,
+    BadRequestResponse,
+    Handler,
+    NotFoundResponse,
+    ProxyRequestRefusedException,
+    Request,
+    TextResponse,
+    ZeroConfig,
+)
 
 
+@patch("gemeaux.App.log")
 @patch("ssl.SSLContext.load_cert_chain")
-def test_get_response_handler(mock_ssl_context, fake_handler, fake_response):
+def test_get_response_handler(mock_ssl_context, mock_log, fake_handler, fake_response):
     app = App(
         urls={"/handler": fake_handler, "/response": fake_response}, config=ZeroConfig()
     )
@@ -23,8 +34,9 @@ def test_get_response_handler(mock_ssl_context, fake_handler, fake_response):
     assert response.origin == "direct"
 
 
+@patch("gemeaux.App.log")
 @patch("ssl.SSLContext.load_cert_chain")
-def test_get_response_exception(mock_ssl_context, fake_handler_exception):
+def test_get_response_exception(mock_ssl_context, mock_log, fake_handler_exception):
     app = App(urls={"": fake_handler_exception}, config=ZeroConfig())
 
     response = app.get_response("")
@@ -32,3 +44,67 @@ def test_get_response_exception(mock_ssl_context, fake_handler_exception):
 
     response = app.get_response("/other")
     assert isinstance(response, NotFoundResponse)
+
+
+@patch("gemeaux.App.log")
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_response_not_found_singleton(mock_ssl_context, mock_log, fake_response):
+    app = App(urls={"/response": fake_response}, config=ZeroConfig())
+    response = app.get_response("/not-found")
+    assert isinstance(response, NotFoundResponse)
+    assert app.get_response("/other-not-found") is response
+    assert bytes(response) == b"51 Route Not Found\r\n"
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_error_response(mock_ssl_context, fake_response):
+    app = App(urls={"/response": fake_response}, config=ZeroConfig())
+    response = app.get_error_response(BadRequestException())
+    assert isinstance(response, BadRequestResponse)
+    assert app.get_error_response(BadRequestException()) is response
+    assert bytes(response) == b"59 BAD REQUEST\r\n"
+
+    response = app.get_error_response(ProxyRequestRefusedException())
+    assert bytes(response) == b"53 PROXY REQUEST REFUSED\r\n"
+    response = app.get_error_response(FileNotFoundError())
+    assert bytes(response) == b"50 OS Error\r\n"
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_mounted_responses_encoded(mock_ssl_context):
+    response = TextResponse(title="Hello")
+    App(urls={"/hello": response}, config=ZeroConfig())
+    assert hasattr(response, "__bytes")
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_response_request(mock_ssl_context):
+    class QueryHandler(Handler):
+        def handle(self, url, path, request=None):
+            return TextResponse(body=f"{path} {request.query}")
+
+    app = App(urls={"/search": QueryHandler()}, config=ZeroConfig())
+    request = Request.parse(b"gemini://localhost/search?gemini\r\n", 1965)
+    response = app.get_response(request)
+    assert bytes(response).endswith(b"/search gemini\r\n")
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_response_legacy_handle(mock_ssl_context):
+    # Written before the `request` argument
+    class LegacyHandler(Handler):
+        def handle(self, url, path):
+            return TextResponse(body=f"legacy {path}")
+
+    class ArgsHandler(Handler):
+        def handle(self, *args):
+            return TextResponse(body=f"{len(args)} arguments")
+
+    app = App(
+        urls={"/legacy": LegacyHandler(), "/args": ArgsHandler()}, config=ZeroConfig()
+    )
+    response = app.get_response(Request.parse(b"gemini://localhost/legacy\r\n", 1965))
+    assert response.status == 20
+    assert bytes(response).endswith(b"legacy /legacy\r\n")
+    response = app.get_response(Request.parse(b"gemini://localhost/args\r\n", 1965))
+    assert bytes(response).endswith(b"3 arguments\r\n")
@@ -37,3 +37,27 @@ def test_get_route_same_prefix(mock_ssl_context, fake_handler, fake_response):
     )
     assert app.get_route("/test") == ("/test", fake_handler)
     assert app.get_route("/test2") == ("/test2", fake_response)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_route_longest_prefix(mock_ssl_context, fake_handler, fake_response):
+    app = App(
+        urls={"": fake_handler, "/a": fake_response, "/a/b/c": fake_handler},
+        config=ZeroConfig(),
+    )
+    assert app.get_route("/a/b") == ("/a", fake_response)
+    assert app.get_route("/a/b/c") == ("/a/b/c", fake_handler)
+    assert app.get_route("/a/b/c/d.gmi") == ("/a/b/c", fake_handler)
+    assert app.get_route("/b") == ("", fake_handler)
+
+
+@patch("ssl.SSLContext.load_cert_chain")
+def test_get_route_many_routes(mock_ssl_context, fake_handler, fake_response):
+    urls = {f"/~user{i}": fake_handler for i in range(1000)}
+    urls["/~user42/special"] = fake_response
+    app = App(urls=urls, config=ZeroConfig())
+    assert app.get_route("/~user1/index.gmi") == ("/~user1", fake_handler)
+    assert app.get_route("/~user999") == ("/~user999", fake_handler)
+    assert app.get_route("/~user42/special/") == ("/~user42/special", fake_response)
+    with pytest.raises(FileNotFoundError):
+        app.get_route("/~nobody")
@@ -1,18 +1,59 @@
+import os
+import time
 from datetime import date
+from unittest.mock import patch
 
 import pytest
 
 from gemeaux import (
+    App,
+    CompiledTemplateResponse,
     DirectoryListingResponse,
     DocumentResponse,
+    EncodedResponse,
     ImproperlyConfigured,
     RedirectResponse,
+    Request,
     StaticHandler,
     TemplateHandler,
     TemplateResponse,
+    ZeroConfig,
+    crlf,
 )
 
 
+class FakeConnection:
+    def __init__(self, data):
+        self.data = data
+        self.sent = b""
+
+    def recv(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        self.sent += data
+
+    def close(self):
+        pass
+
+
+def serve(handler, path="/"):
+    """
+    Send a request to the handler through ``App.handle_request``, and return the
+    bytes received by the client.
+    """
+    app = App(urls={"": handler}, config=ZeroConfig())
+    app.port = 1965
+    connection = FakeConnection(f"gemini://localhost{path}\r\n".encode())
+    with patch("gemeaux.App.log_access"):
+        app.handle_request(connection, "127.0.0.1")
+    return connection.sent
+
+
 def test_static_handler_not_a_directory():
     with pytest.raises(ImproperlyConfigured):
         StaticHandler("/tmp/not-a-directory")
@@ -22,25 +63,25 @@ def test_static_handler_document(index_directory, index_content, other_content):
     handler = StaticHandler(index_directory)
     response = handler.get_response("", "/")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(index_content, encoding="utf-8")
+    assert response.content == crlf(bytes(index_content, encoding="utf-8"))
 
     # Reaching directly index.gmi
     handler = StaticHandler(index_directory)
     response = handler.get_response("", "/index.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(index_content, encoding="utf-8")
+    assert response.content == crlf(bytes(index_content, encoding="utf-8"))
 
     # Reaching directly index.gmi / no starting slash
     handler = StaticHandler(index_directory)
     response = handler.get_response("/", "index.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(index_content, encoding="utf-8")
+    assert response.content == crlf(bytes(index_content, encoding="utf-8"))
 
     # Reaching directly other.gmi
     handler = StaticHandler(index_directory)
     response = handler.get_response("", "/other.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(other_content, encoding="utf-8")
+    assert response.content == crlf(bytes(other_content, encoding="utf-8"))
 
 
 def test_static_handler_subdir(index_directory, sub_content):
@@ -48,7 +89,7 @@ def test_static_handler_subdir(index_directory, sub_content):
     handler = StaticHandler(index_directory)
     response = handler.get_response("", "/subdir/sub.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(sub_content, encoding="utf-8")
+    assert response.content == crlf(bytes(sub_content, encoding="utf-8"))
 
     # No Index -> Directory Listing
     handler = StaticHandler(index_directory)
@@ -67,7 +108,7 @@ def test_static_handler_sub_url(index_directory, index_content):
     handler = StaticHandler(index_directory)
     response = handler.get_response("/test", "/test/index.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(index_content, encoding="utf-8")
+    assert response.content == crlf(bytes(index_content, encoding="utf-8"))
 
 
 def test_static_handler_not_found(index_directory):
@@ -92,7 +133,7 @@ def test_static_handler_no_directory_listing(
     # No change in response for "/"
     response = handler.get_response("", "/")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(index_content, encoding="utf-8")
+    assert response.content == crlf(bytes(index_content, encoding="utf-8"))
 
     # Subdir + no slash -> Redirect to "/"
     response = handler.get_response("", "/subdir")
@@ -106,7 +147,7 @@ def test_static_handler_no_directory_listing(
     # subdir/sub.gmi
     response = handler.get_response("", "/subdir/sub.gmi")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(sub_content, encoding="utf-8")
+    assert response.content == crlf(bytes(sub_content, encoding="utf-8"))
 
 
 def test_static_handler_alternate_index(index_directory, other_content):
@@ -114,7 +155,7 @@ def test_static_handler_alternate_index(index_directory, other_content):
     # "/" returns other.gmi content
     response = handler.get_response("", "/")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(other_content, encoding="utf-8")
+    assert response.content == crlf(bytes(other_content, encoding="utf-8"))
 
     # Subdir -> no other.gmi -> directory listing
     response = handler.get_response("", "/subdir/")
@@ -129,13 +170,174 @@ def test_static_handler_alternate_index_no_dirlist(index_directory, other_conten
     # "/" returns other.gmi content
     response = handler.get_response("", "/")
     assert isinstance(response, DocumentResponse)
-    assert response.content == bytes(other_content, encoding="utf-8")
+    assert response.content == crlf(bytes(other_content, encoding="utf-8"))
 
     # Subdir -> no other.gmi -> no directory listing
     with pytest.raises(FileNotFoundError):
         response = handler.get_response("", "/subdir/")
 
 
+def test_static_handler_cache(index_directory, index_content):
+    handler = StaticHandler(index_directory, cache_size=1024)
+    response = handler.get_response("", "/")
+    assert isinstance(response, EncodedResponse)
+    expected = b"20 text/gemini\r\n" + bytes(index_content, encoding="utf-8") + b"\r\n"
+    assert bytes(response) == expected
+    # Same object, served from the cache
+    assert handler.get_response("", "/") is response
+    assert handler.get_response("", "/index.gmi") is not response
+    assert len(handler.cache) == 2
+
+    # Directory without trailing slash are still redirected
+    response = handler.get_response("", "/subdir")
+    assert isinstance(response, RedirectResponse)
+    # Directory listings are not cached
+    response = handler.get_response("", "/subdir/")
+    assert isinstance(response, DirectoryListingResponse)
+    assert len(handler.cache) == 2
+
+
+def test_static_handler_cache_served(index_directory, index_content):
+    handler = StaticHandler(index_directory, cache_size=1024)
+    expected = b"20 text/gemini\r\n" + bytes(index_content, encoding="utf-8") + b"\r\n"
+    # Miss, then hit
+    assert serve(handler, "/index.gmi") == expected
+    assert serve(handler, "/index.gmi") == expected
+    assert len(handler.cache) == 1
+
+
+def test_static_handler_cache_invalidation(index_directory):
+    handler = StaticHandler(index_directory, cache_size=1024, cache_check_interval=0)
+    response = handler.get_response("", "/other.gmi")
+    assert handler.get_response("", "/other.gmi") is response
+
+    # The file is modified
+    other = index_directory.join("other.gmi")
+    other.write_text("# Modified", encoding="utf-8")
+    stat = os.stat(other.strpath)
+    os.utime(other.strpath, (stat.st_atime, stat.st_mtime + 10))
+    response = handler.get_response("", "/other.gmi")
+    assert bytes(response) == b"20 text/gemini\r\n# Modified\r\n"
+
+    # The file is removed
+    other.remove()
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/other.gmi")
+    assert len(handler.cache) == 0
+
+
+def test_static_handler_cache_size(index_directory):
+    # Too small to store any document
+    handler = StaticHandler(index_directory, cache_size=10)
+    response = handler.get_response("", "/")
+    assert isinstance(response, DocumentResponse)
+    assert len(handler.cache) == 0
+
+
+def test_static_handler_not_found_cache(index_directory):
+    handler = StaticHandler(index_directory, not_found_cache_size=2)
+    response = handler.get_response("", "/wp-admin")
+    assert bytes(response) == b"51 Path not found\r\n"
+    assert handler.get_response("", "/.env") is response
+    assert len(handler.not_found_cache) == 2
+
+    # Served without checking the file system
+    with patch("gemeaux.handlers.isdir") as mock_isdir:
+        assert handler.get_response("", "/wp-admin") is response
+    assert not mock_isdir.called
+
+    # The least recently used paths are forgotten
+    handler.get_response("", "/xmlrpc.php")
+    assert "wp-admin" in handler.not_found_cache
+    assert ".env" not in handler.not_found_cache
+    # Existing paths are not remembered
+    assert isinstance(handler.get_response("", "/other.gmi"), DocumentResponse)
+    assert len(handler.not_found_cache) == 2
+
+
+def test_static_handler_not_found_cache_ttl(index_directory):
+    handler = StaticHandler(
+        index_directory, not_found_cache_size=10, not_found_cache_ttl=0.05
+    )
+    assert handler.get_response("", "/new.gmi").status == 51
+    index_directory.join("new.gmi").write_text("# New", encoding="utf-8")
+    # Still remembered as missing
+    assert handler.get_response("", "/new.gmi").status == 51
+    time.sleep(0.05)
+    assert isinstance(handler.get_response("", "/new.gmi"), DocumentResponse)
+    assert "new.gmi" not in handler.not_found_cache
+
+
+def test_static_handler_resolve(index_directory):
+    handler = StaticHandler(index_directory)
+    info = handler.resolve(index_directory.join("other.gmi").strpath)
+    assert info.kind == "file"
+    assert info.size == index_directory.join("other.gmi").size()
+    assert info.mimetype == "text/gemini"
+    info = handler.resolve(index_directory.strpath)
+    assert info.kind == "directory"
+    assert info.index is True
+    assert handler.resolve(index_directory.join("subdir").strpath).index is False
+    assert handler.resolve(index_directory.join("missing").strpath).kind is None
+
+
+def test_static_handler_stat_cache(index_directory):
+    handler = StaticHandler(
+        index_directory, stat_cache_size=100, stat_cache_interval=60
+    )
+    response = handler.get_response("", "/other.gmi")
+    assert isinstance(response, DocumentResponse)
+    assert isinstance(handler.get_response("", "/subdir/"), DirectoryListingResponse)
+    assert len(handler.stat_cache) == 2
+
+    # No metadata read on the next requests
+    with patch("gemeaux.handlers.stat") as mock_stat, patch(
+        "gemeaux.responses.isfile"
+    ) as mock_isfile, patch("gemeaux.responses.isdir") as mock_isdir:
+        assert handler.get_response("", "/other.gmi").content == response.content
+        handler.get_response("", "/subdir/")
+    assert not mock_stat.called
+    assert not mock_isfile.called
+    assert not mock_isdir.called
+
+
+def test_static_handler_stat_cache_interval(index_directory):
+    handler = StaticHandler(
+        index_directory, stat_cache_size=100, stat_cache_interval=60
+    )
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/new.gmi")
+    index_directory.join("new.gmi").write_text("# New", encoding="utf-8")
+    # The missing path is remembered until the next check
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/new.gmi")
+
+    handler.stat_cache_interval = 0
+    response = handler.get_response("", "/new.gmi")
+    assert response.content == b"# New\r\n"
+
+
+def test_static_handler_stat_cache_shared(index_directory):
+    # The document cache is validated through the stat cache
+    handler = StaticHandler(
+        index_directory,
+        cache_size=1024,
+        cache_check_interval=0,
+        stat_cache_size=100,
+        stat_cache_interval=60,
+    )
+    response = handler.get_response("", "/other.gmi")
+    with patch("gemeaux.handlers.stat") as mock_stat:
+        assert handler.get_response("", "/other.gmi") is response
+    assert not mock_stat.called
+
+    index_directory.join("other.gmi").remove()
+    handler.stat_cache_interval = 0
+    with pytest.raises(FileNotFoundError):
+        handler.get_response("", "/other.gmi")
+    assert len(handler.cache) == 0
+
+
 def test_template_handler_getter(template_file):
     class TemplateHandlerWithGetter(TemplateHandler):
         def get_context(self, *args, **kwargs):
@@ -167,3 +369,140 @@ def test_template_handler_classattr(template_file):
     assert response.status == 20
     expected_body = f"First var: {date.today()} / Second var: hello"
     assert response.__body__().startswith(bytes(expected_body, encoding="utf-8"))
+
+
+def test_template_handler_response_class(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text("Hello {{ name }}", "utf-8")
+
+    class CompiledTemplateHandler(TemplateHandler):
+        response_class = CompiledTemplateResponse
+
+        def get_context(self, *args, **kwargs):
+            return {"name": "World"}
+
+    CompiledTemplateHandler.template_file = template_file
+    response = CompiledTemplateHandler().get_response("", "/")
+    assert isinstance(response, CompiledTemplateResponse)
+    assert bytes(response).endswith(b"Hello World\r\n")
+
+
+def test_template_handler_compiled_error(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text("# {{ title }}\n{{ missing }}\n", "utf-8")
+
+    class CompiledTemplateHandler(TemplateHandler):
+        response_class = CompiledTemplateResponse
+
+        def get_context(self, *args, **kwargs):
+            return {"title": "Title"}
+
+    CompiledTemplateHandler.template_file = template_file
+    # The error is raised before the success meta line is sent
+    assert serve(CompiledTemplateHandler()) == b"50 missing\r\n"
+
+
+def test_template_handler_cache_ttl(template_file):
+    contexts = []
+
+    class CachedTemplateHandler(TemplateHandler):
+        cache_ttl = 60
+
+        def get_context(self, *args, **kwargs):
+            contexts.append(1)
+            return {"var1": len(contexts), "var2": "hello"}
+
+    CachedTemplateHandler.template_file = template_file
+    handler = CachedTemplateHandler()
+    response = handler.handle("", "/")
+    assert isinstance(response, EncodedResponse)
+    assert response.status == 20
+    assert b"First var: 1 / Second var: hello" in bytes(response)
+    assert handler.handle("", "/") is response
+    assert len(contexts) == 1
+    # Another path is another cache entry
+    assert b"First var: 2" in bytes(handler.handle("", "/other"))
+
+
+def test_template_handler_cache_served(template_file):
+    contexts = []
+
+    class CachedTemplateHandler(TemplateHandler):
+        cache_ttl = 60
+
+        def get_context(self, *args, **kwargs):
+            contexts.append(1)
+            return {"var1": len(contexts), "var2": "hello"}
+
+    CachedTemplateHandler.template_file = template_file
+    handler = CachedTemplateHandler()
+    expected = b"20 text/gemini; charset=utf-8\r\nFirst var: 1 / Second var: hello\r\n"
+    # Miss, then fresh hit
+    assert serve(handler) == expected
+    assert serve(handler) == expected
+    assert len(contexts) == 1
+    # Stale hit: the stale response is served, while it's rendered again
+    cache = handler.response_cache
+    value, _ = cache.entries.get("/")
+    cache.entries.set("/", (value, time.monotonic() - 90))
+    assert serve(handler) == expected
+    for _ in range(100):
+        if len(contexts) == 2 and not cache.renders:
+            break
+        time.sleep(0.01)
+    assert serve(handler) == expected.replace(b"First var: 1", b"First var: 2")
+
+
+def test_template_handler_cache_key(template_file):
+    class CachedTemplateHandler(TemplateHandler):
+        cache_ttl = 60
+
+        def cache_key(self, url, path, request=None):
+            return url
+
+    CachedTemplateHandler.template_file = template_file
+    handler = CachedTemplateHandler()
+    handler.get_context = lambda: {"var1": 1, "var2": 2}
+    response = handler.handle("", "/")
+    assert handler.handle("", "/other") is response
+
+
+def test_template_handler_legacy_cache_key(template_file):
+    class CachedTemplateHandler(TemplateHandler):
+        cache_ttl = 60
+
+        # Written before the `request` argument
+        def cache_key(self, url, path):
+            return url
+
+    CachedTemplateHandler.template_file = template_file
+    handler = CachedTemplateHandler()
+    handler.get_context = lambda: {"var1": 1, "var2": 2}
+    request = Request.parse(b"gemini://localhost/?query\r\n", 1965)
+    response = handler.handle("", "/", request)
+    assert response.status == 20
+    assert handler.handle("", "/other", request) is response
+
+
+def test_handler_cache_disabled(template_file):
+    class UncachedTemplateHandler(TemplateHandler):
+        def get_context(self, *args, **kwargs):
+            return {"var1": 1, "var2": 2}
+
+    UncachedTemplateHandler.template_file = template_file
+    handler = UncachedTemplateHandler()
+    assert isinstance(handler.handle("", "/"), TemplateResponse)
+    assert handler.response_cache is None
+
+
+def test_template_handler_cache_query(template_file):
+    class CachedTemplateHandler(TemplateHandler):
+        cache_ttl = 60
+
+    CachedTemplateHandler.template_file = template_file
+    handler = CachedTemplateHandler()
+    handler.get_context = lambda: {"var1": 1, "var2": 2}
+    request = Request("gemini://localhost/?hello", path="/", query="hello")
+    response = handler.handle("", "/", request)
+    assert handler.handle("", "/") is not response
+    assert handler.handle("", "/", request) is response
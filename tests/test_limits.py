@@ -0,0 +1,76 @@
+from gemeaux.limits import RateLimiter
+
+
+def test_token_bucket():
+    limiter = RateLimiter(rate=2, burst=3)
+    # The burst is allowed at once
+    for _ in range(3):
+        assert limiter.acquire("1.2.3.4", now=0) == 0
+        limiter.release("1.2.3.4")
+    # Then the client has to wait for a token
+    assert limiter.acquire("1.2.3.4", now=0) == 1
+    assert limiter.acquire("1.2.3.4", now=0.5) == 0
+    assert limiter.acquire("1.2.3.4", now=0.6) == 1
+    # Other clients have their own bucket
+    assert limiter.acquire("5.6.7.8", now=0.6) == 0
+
+
+def test_token_bucket_retry_delay():
+    limiter = RateLimiter(rate=0.1, burst=1)
+    assert limiter.acquire("1.2.3.4", now=0) == 0
+    # One token every 10 seconds
+    assert limiter.acquire("1.2.3.4", now=0) == 10
+    assert limiter.acquire("1.2.3.4", now=4) == 6
+    assert limiter.acquire("1.2.3.4", now=10) == 0
+
+
+def test_max_connections():
+    limiter = RateLimiter(max_connections=2)
+    assert limiter.acquire("1.2.3.4") == 0
+    assert limiter.acquire("1.2.3.4") == 0
+    assert limiter.acquire("1.2.3.4") == RateLimiter.CONNECTIONS_DELAY
+    assert limiter.acquire("5.6.7.8") == 0
+    limiter.release("1.2.3.4")
+    assert limiter.acquire("1.2.3.4") == 0
+    # Clients without open connection are forgotten
+    limiter.release("5.6.7.8")
+    assert "5.6.7.8" not in limiter.clients
+    # Unknown clients are ignored
+    limiter.release("9.9.9.9")
+
+
+def test_expire_idle_clients():
+    limiter = RateLimiter(rate=1, burst=2)
+    for index in range(10):
+        limiter.acquire(f"10.0.0.{index}", now=0)
+        limiter.release(f"10.0.0.{index}")
+    assert len(limiter) == 10
+    # The buckets are not full yet
+    limiter.acquire("10.0.1.0", now=1)
+    assert len(limiter) == 11
+    # Full buckets: a few idle clients are forgotten at each connection
+    limiter.acquire("10.0.1.1", now=2)
+    assert len(limiter) == 10
+    assert "10.0.0.0" not in limiter.clients
+    for index in range(10):
+        limiter.acquire("10.0.1.0", now=3 + index)
+    assert set(limiter.clients) == {"10.0.1.0", "10.0.1.1"}
+
+
+def test_expire_connected_clients():
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire("1.2.3.4", now=0)
+    limiter.acquire("5.6.7.8", now=0)
+    limiter.release("5.6.7.8")
+    limiter.acquire("9.9.9.9", now=10)
+    # Still connected, not forgotten
+    assert "1.2.3.4" in limiter.clients
+    assert "5.6.7.8" not in limiter.clients
+
+
+def test_max_clients():
+    limiter = RateLimiter(rate=1, burst=10, max_clients=3)
+    for index in range(5):
+        limiter.acquire(f"10.0.0.{index}", now=0)
+        limiter.release(f"10.0.0.{index}")
+    assert list(limiter.clients) == ["10.0.0.2", "10.0.0.3", "10.0.0.4"]
@@ -0,0 +1,93 @@
+import gc
+import time
+import weakref
+from unittest.mock import patch
+
+from gemeaux.logs import STARTED_LOGS, AccessLog, flush_all
+
+
+def test_access_log_flush(capsys):
+    log = AccessLog(flush_interval=60)
+    log.write("access line")
+    log.write("error line", error=True)
+    # Nothing is written until the flush
+    assert capsys.readouterr().out == ""
+    log.flush()
+    captured = capsys.readouterr()
+    assert captured.out == "access line\n"
+    assert captured.err == "error line\n"
+
+
+def test_access_log_background_flush(tmpdir):
+    path = str(tmpdir.join("access.log"))
+    log = AccessLog(path=path, flush_lines=2, flush_interval=10)
+    log.write("line 1")
+    log.write("line 2")
+    # The flush thread is woken up by the second line
+    for _ in range(100):
+        if tmpdir.join("access.log").exists() and log.pending == []:
+            break
+        time.sleep(0.01)
+    log.flush()
+    assert tmpdir.join("access.log").read() == "line 1\nline 2\n"
+
+
+def test_access_log_max_pending():
+    log = AccessLog(max_pending=2, flush_interval=60)
+    for index in range(5):
+        log.write(f"line {index}")
+    assert [line for line, _ in log.pending] == ["line 0", "line 1"]
+    assert log.dropped == 3
+    log.pending.clear()
+
+
+def test_access_log_sample():
+    log = AccessLog(sample_rate=0)
+    assert not log.sample()
+    assert log.dropped == 1
+    log = AccessLog(sample_rate=1)
+    assert log.sample()
+    assert log.dropped == 0
+
+
+def test_access_log_timestamp():
+    log = AccessLog(timestamp_format="%Y")
+    with patch("time.strftime", return_value="2020") as mock_strftime:
+        assert log.timestamp() == "2020"
+        assert log.timestamp() == "2020"
+    # Formatted once per second
+    assert mock_strftime.call_count == 1
+
+
+def test_access_log_rotation(tmpdir):
+    path = str(tmpdir.join("access.log"))
+    log = AccessLog(path=path, max_bytes=10, backup_count=2)
+    for index in range(4):
+        log.write(f"line {index}")
+        log.flush()
+    assert tmpdir.join("access.log").read() == "line 3\n"
+    assert tmpdir.join("access.log.1").read() == "line 2\n"
+    assert tmpdir.join("access.log.2").read() == "line 1\n"
+    assert not tmpdir.join("access.log.3").exists()
+
+
+def test_access_log_flush_all(capsys):
+    with patch("atexit.register") as mock_register:
+        log = AccessLog(flush_interval=60)
+    # A single hook for all the writers, registered at import
+    mock_register.assert_not_called()
+    log.write("access line")
+    assert log in STARTED_LOGS
+    flush_all()
+    assert capsys.readouterr().out == "access line\n"
+
+
+def test_access_log_collected():
+    log = AccessLog(flush_interval=60)
+    log.write("access line")
+    log.flush()
+    ref = weakref.ref(log)
+    del log
+    gc.collect()
+    # Neither the exit hook nor the flush thread keep it alive
+    assert ref() is None
@@ -0,0 +1,114 @@
+from unittest.mock import patch
+
+import pytest
+
+from gemeaux import (
+    ImproperlyConfigured,
+    Metrics,
+    MetricsHandler,
+    MetricsResponse,
+    Timing,
+)
+from gemeaux.metrics import Histogram
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.cumulative() == [(0.1, 2), (1, 3), ("+Inf", 4)]
+
+
+def test_metrics_record():
+    metrics = Metrics()
+    metrics.record_request("/", 20, 0.01, 100)
+    metrics.record_request("/", 20, 0.02, 100)
+    metrics.record_request(None, 51, 0.001, 20)
+    metrics.record_exception(FileNotFoundError())
+    metrics.increment("handshake_failures")
+    assert metrics.requests == {("/", 20): 2, ("-", 51): 1}
+    assert metrics.durations["/"].count == 2
+    assert metrics.bytes_sent == 220
+    assert metrics.exceptions == {"FileNotFoundError": 1}
+    assert metrics.counters == {"handshake_failures": 1}
+
+    metrics.clear()
+    assert metrics.requests == {}
+    assert metrics.bytes_sent == 0
+
+
+def test_metrics_render_gemtext():
+    metrics = Metrics()
+    metrics.record_request("/", 20, 0.01, 100)
+    metrics.increment("dropped_requests", 2)
+    text = metrics.render_gemtext()
+    assert text.startswith("# Metrics\n")
+    assert "Bytes sent: 100\n" in text
+    assert "dropped_requests: 2\n" in text
+    assert "* / 20: 1\n" in text
+    assert "* /: 1 requests, 10.00ms average\n" in text
+
+
+def test_metrics_render_prometheus():
+    metrics = Metrics(buckets=(0.1,))
+    metrics.record_request('/"quoted"', 20, 0.01, 100)
+    metrics.record_exception(ValueError())
+    metrics.increment("handshake_failures")
+    text = metrics.render_prometheus()
+    assert 'gemeaux_requests_total{route="/\\"quoted\\"",status="20"} 1\n' in text
+    assert (
+        'gemeaux_request_duration_seconds_bucket{route="/\\"quoted\\"",le="0.1"} 1\n'
+        in text
+    )
+    assert (
+        'gemeaux_request_duration_seconds_bucket{route="/\\"quoted\\"",le="+Inf"} 1\n'
+        in text
+    )
+    assert 'gemeaux_request_duration_seconds_count{route="/\\"quoted\\""} 1\n' in text
+    assert "gemeaux_sent_bytes_total 100\n" in text
+    assert 'gemeaux_exceptions_total{type="ValueError"} 1\n' in text
+    assert "gemeaux_handshake_failures_total 1\n" in text
+
+
+def test_metrics_handler():
+    metrics = Metrics()
+    metrics.record_request("/", 20, 0.01, 100)
+    response = MetricsHandler(metrics=metrics).handle("/metrics", "/metrics")
+    assert isinstance(response, MetricsResponse)
+    assert bytes(response).startswith(b"20 text/gemini; charset=utf-8\r\n# Metrics\r\n")
+
+    response = MetricsHandler("prometheus", metrics).handle("/metrics", "/metrics")
+    payload = bytes(response)
+    assert payload.startswith(b"20 text/plain; version=0.0.4; charset=utf-8\r\n")
+    assert b"gemeaux_sent_bytes_total 100\r\n" in payload
+
+    with pytest.raises(ImproperlyConfigured):
+        MetricsHandler("xml")
+
+
+def test_timing():
+    with patch("time.monotonic", side_effect=[1.5, 2.5, 4.5]):
+        timing = Timing(1.0)
+        timing.lap("accept")
+        timing.lap("handshake")
+        timing.lap("handshake")
+    assert timing.started == 1.0
+    assert timing.accept == 0.5
+    assert timing.handshake == 3.0
+    assert timing.send == 0.0
+    assert str(timing).startswith("accept=500.000ms handshake=3000.000ms recv=0.000ms")
+
+
+def test_metrics_record_timing():
+    metrics = Metrics()
+    timing = Timing()
+    timing.handler = 0.02
+    metrics.record_timing(timing)
+    assert metrics.phases["handler"].count == 1
+    assert "* handler: 20.000ms average\n" in metrics.render_gemtext()
+    assert 'gemeaux_phase_duration_seconds_count{phase="handler"} 1\n' in (
+        metrics.render_prometheus()
+    )
@@ -0,0 +1,72 @@
+import pytest
+
+from gemeaux import (
+    BadRequestException,
+    ProxyRequestRefusedException,
+    Request,
+    TimeoutException,
+)
+
+PORT = 1965
+
+
+def test_request_parse():
+    request = Request.parse(b"gemini://localhost/path/page.gmi\r\n", PORT, "127.0.0.1")
+    assert request.url == "gemini://localhost/path/page.gmi"
+    assert request.scheme == "gemini"
+    assert request.host == "localhost"
+    assert request.port == PORT
+    assert request.path == "/path/page.gmi"
+    assert request.query == ""
+    assert request.peer == "127.0.0.1"
+
+
+def test_request_parse_port_query():
+    request = Request.parse(b"gemini://localhost:1965/search?hello%20world\r\n", PORT)
+    assert request.host == "localhost"
+    assert request.port == PORT
+    assert request.path == "/search"
+    assert request.query == "hello%20world"
+
+    request = Request.parse("gemini://localhost?hello\r\n", PORT)
+    assert request.path == ""
+    assert request.query == "hello"
+
+
+def test_request_parse_fallback():
+    # Unusual URLs are parsed by urlparse
+    request = Request.parse(b"gemini://user@localhost:1965/path#fragment\r\n", PORT)
+    assert request.host == "localhost"
+    assert request.path == "/path"
+    request = Request.parse(b"gemini://[::1]/path?q\r\n", PORT)
+    assert request.host == "::1"
+    assert request.port == PORT
+    assert request.query == "q"
+    request = Request.parse(b"gemini://localhost/path \r\n", PORT)
+    assert request.url == "gemini://localhost/path"
+    assert request.path == "/path"
+
+
+def test_request_parse_errors():
+    with pytest.raises(TimeoutException):
+        Request.parse(b"gemini://localhost/\n", PORT)
+    with pytest.raises(BadRequestException):
+        Request.parse(b"localhost/\r\n", PORT)
+    with pytest.raises(ProxyRequestRefusedException):
+        Request.parse(b"https://localhost/\r\n", PORT)
+    with pytest.raises(ProxyRequestRefusedException):
+        Request.parse(b"gemini://localhost:1966/\r\n", PORT)
+    with pytest.raises(ProxyRequestRefusedException):
+        Request.parse(b"gemini://[::1]:1966/\r\n", PORT)
+    with pytest.raises(BadRequestException):
+        Request.parse(b"gemini://localhost:port/\r\n", PORT)
+    with pytest.raises(UnicodeDecodeError):
+        Request.parse(b"gemini://localhost/\xff\r\n", PORT)
+
+
+def test_request_parse_length():
+    # The length is checked before decoding
+    url = b"gemini://localhost/" + b"0" * (1024 - len(b"gemini://localhost/"))
+    assert Request.parse(url + b"\r\n", PORT).url == url.decode()
+    with pytest.raises(BadRequestException):
+        Request.parse(url + b"0\r\n", PORT)
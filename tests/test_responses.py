@@ -2,8 +2,10 @@ import pytest
 
 from gemeaux import (
     BadRequestResponse,
+    CompiledTemplateResponse,
     DirectoryListingResponse,
     DocumentResponse,
+    EncodedResponse,
     InputResponse,
     NotFoundResponse,
     PermanentFailureResponse,
@@ -12,6 +14,7 @@ from gemeaux import (
     RedirectResponse,
     Response,
     SensitiveInputResponse,
+    SlowDownResponse,
     SuccessResponse,
     TemplateError,
     TemplateResponse,
@@ -99,6 +102,14 @@ def test_proxy_refused_response():
     assert bytes(response) == b"53 PROXY REQUEST REFUSED\r\n"
 
 
+def test_slow_down_response():
+    response = SlowDownResponse()
+    assert response.status == 44
+    assert response.__body__() is None
+    assert bytes(response) == b"44 1\r\n"
+    assert bytes(SlowDownResponse(30)) == b"44 30\r\n"
+
+
 def test_bad_request_response():
     response = BadRequestResponse()
     assert response.status == 59
@@ -120,7 +131,8 @@ def test_document_response(index_directory, index_content):
     assert response.status == 20
     bytes_content = bytes(index_content, encoding="utf-8")
     bytes_body = b"20 text/gemini\r\n" + bytes_content + b"\r\n"
-    assert response.__body__() == bytes_content
+    # Line endings are normalized when the document is loaded
+    assert response.__body__() == bytes_content + b"\r\n"
     assert bytes(response) == bytes_body
 
 
@@ -160,6 +172,40 @@ def test_document_response_binary(index_directory, image_content):
     assert bytes(response) == bytes_body
 
 
+def test_document_response_streaming(
+    index_directory, multi_line_content_crlf, image_content
+):
+    class StreamingDocumentResponse(DocumentResponse):
+        STREAMING_MIN_SIZE = 1
+        CHUNK_SIZE = 5
+
+    response = StreamingDocumentResponse(
+        index_directory.join("multi_line.gmi").strpath, index_directory.strpath
+    )
+    assert response.streaming
+    assert response.content is None
+    chunks = list(response.stream())
+    assert len(chunks) > 2
+    multi_line_body_expected = bytes(multi_line_content_crlf, encoding="utf-8")
+    assert b"".join(chunks) == b"20 text/gemini\r\n" + multi_line_body_expected
+    # Still available as a whole
+    assert bytes(response) == b"".join(chunks)
+
+    # Binary content is not altered
+    response = StreamingDocumentResponse(
+        index_directory.join("image.png").strpath, index_directory.strpath
+    )
+    assert b"".join(response.stream()) == b"20 image/png\r\n" + image_content
+
+
+def test_document_response_not_streaming(index_directory, index_content):
+    response = DocumentResponse(
+        index_directory.join("index.gmi").strpath, index_directory.strpath
+    )
+    assert not response.streaming
+    assert list(response.stream()) == [bytes(response)]
+
+
 def test_directory_listing(index_directory):
     response = DirectoryListingResponse(
         index_directory.strpath, index_directory.strpath
@@ -263,3 +309,122 @@ def test_template_response_not_a_template():
         TemplateResponse("/tmp/not-a-template")
     except Exception as exc:
         assert exc.args == ("Template file not found: `/tmp/not-a-template`",)
+
+
+def test_encoded_response():
+    response = EncodedResponse(b"20 text/plain\r\nhello", 20, "text/plain")
+    assert response.status == 20
+    assert response.mimetype == "text/plain"
+    assert bytes(response) == b"20 text/plain\r\nhello"
+    assert len(response) == 20
+
+    response = EncodedResponse.from_response(NotFoundResponse())
+    assert response.status == 51
+    assert bytes(response) == b"51 NOT FOUND\r\n"
+
+
+def test_encoded_response_stream():
+    response = EncodedResponse.from_response(TextResponse("t", "hello"))
+    assert list(response.stream()) == [
+        b"20 text/gemini; charset=utf-8\r\n# t\r\n\r\nhello\r\n"
+    ]
+
+
+class GeneratorResponse(SuccessResponse):
+    def __body__(self):
+        yield b"# Title\n"
+        yield b""
+        yield b"First line\r"
+        yield b"\nSecond line"
+
+
+def test_generator_response_stream():
+    response = GeneratorResponse()
+    chunks = response.stream()
+    # The META line is sent first
+    assert next(chunks) == b"20 text/gemini; charset=utf-8\r\n"
+    assert len(response) == 31
+    body = b"".join(chunks)
+    assert body == b"# Title\r\nFirst line\r\nSecond line\r\n"
+    # Running byte count
+    assert len(response) == 31 + len(body)
+
+
+def test_generator_response_bytes():
+    response = GeneratorResponse()
+    assert bytes(response) == (
+        b"20 text/gemini; charset=utf-8\r\n# Title\r\nFirst line\r\nSecond line\r\n"
+    )
+    # Already encoded: sent at once
+    assert list(response.stream()) == [bytes(response)]
+
+
+def test_generator_response_binary():
+    class BinaryGeneratorResponse(GeneratorResponse):
+        mimetype = "application/octet-stream"
+
+    response = BinaryGeneratorResponse()
+    assert b"".join(response.stream()) == (
+        b"20 application/octet-stream\r\n# Title\nFirst line\r\nSecond line"
+    )
+
+
+def test_compiled_template_response(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text(
+        "# {{ title }}\n{% for item in items %}\n* {{ item }}\n{% endfor %}", "utf-8"
+    )
+    response = CompiledTemplateResponse(template_file, title="List", items=[1, 2])
+    assert response.status == 20
+    assert bytes(response) == (
+        b"20 text/gemini; charset=utf-8\r\n# List\r\n* 1\r\n* 2\r\n"
+    )
+
+
+def test_compiled_template_response_chunks(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    # Loops with a block are rendered item by item
+    template_file.write_text(
+        "{% for item in items %}{% if item %}{{ item }}\n{% endif %}{% endfor %}",
+        "utf-8",
+    )
+
+    class SmallChunksResponse(CompiledTemplateResponse):
+        CHUNK_SIZE = 11
+
+    response = SmallChunksResponse(template_file, items=["0123456789"] * 3)
+    chunks = list(response.__body__())
+    assert chunks == [b"0123456789\r\n"] * 3
+
+
+def test_compiled_template_response_crlf(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text(
+        "{% for item in items %}{% if item %}{{ item }}{% endif %}{% endfor %}", "utf-8"
+    )
+
+    class SmallChunksResponse(CompiledTemplateResponse):
+        CHUNK_SIZE = 4
+
+    # Line endings in the variables, with a "\r\n" split between two chunks
+    response = SmallChunksResponse(template_file, items=["a\nbc\r", "\nd\re"])
+    assert response.crlf_normalized
+    assert b"".join(response.stream()) == (
+        b"20 text/gemini; charset=utf-8\r\na\r\nbc\r\nd\r\ne\r\n"
+    )
+
+
+def test_compiled_template_response_error(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text("# {{ title }}\n{{ missing }}\n", "utf-8")
+    # Raised before the response is sent
+    with pytest.raises(TemplateError):
+        CompiledTemplateResponse(template_file, title="Title")
+
+
+def test_compiled_template_response_twice(tmpdir):
+    template_file = tmpdir.join("template.gmi")
+    template_file.write_text("# {{ title }}", "utf-8")
+    response = CompiledTemplateResponse(template_file, title="Title")
+    assert b"".join(response.__body__()) == b"# Title\r\n"
+    assert b"".join(response.__body__()) == b"# Title\r\n"
@@ -0,0 +1,140 @@
+import os
+from datetime import date
+from string import Template
+
+import pytest
+
+from gemeaux import TemplateError
+from gemeaux.templates import (
+    CompiledTemplate,
+    CompiledTemplateRegistry,
+    TemplateRegistry,
+)
+
+
+def test_registry(template_file):
+    registry = TemplateRegistry()
+    template = registry.get(template_file)
+    assert isinstance(template, Template)
+    assert registry.misses == 1
+    assert registry.hits == 0
+
+    # Compiled once
+    assert registry.get(template_file) is template
+    assert registry.get(template_file.strpath) is template
+    assert registry.misses == 1
+    assert registry.hits == 2
+
+
+def test_registry_reload(template_file):
+    registry = TemplateRegistry()
+    template = registry.get(template_file)
+
+    template_file.write_text("Modified: $var1", encoding="utf-8")
+    stat = os.stat(template_file.strpath)
+    os.utime(template_file.strpath, (stat.st_atime, stat.st_mtime + 10))
+    new_template = registry.get(template_file)
+    assert new_template is not template
+    assert new_template.substitute(var1="value") == "Modified: value"
+    assert registry.misses == 2
+
+
+def test_registry_not_found(tmpdir):
+    registry = TemplateRegistry()
+    with pytest.raises(TemplateError):
+        registry.get("/tmp/not-a-template")
+    # Directories are not templates
+    with pytest.raises(TemplateError):
+        registry.get(tmpdir)
+
+
+def render(source, **context):
+    return "".join(CompiledTemplate(source).render(context))
+
+
+def test_compiled_template_variables():
+    assert render("Hello {{ name }}!", name="World") == "Hello World!"
+    assert render("{{ user.name }}", user={"name": "Gus"}) == "Gus"
+    assert render("{{ today.year }}", today=date(2020, 12, 1)) == "2020"
+    assert render("{{ items.1 }}", items=["a", "b"]) == "b"
+    assert render("No variable") == "No variable"
+    assert render("") == ""
+
+
+def test_compiled_template_missing_variable():
+    with pytest.raises(TemplateError):
+        render("Hello {{ name }}!")
+    with pytest.raises(TemplateError):
+        render("Hello {{ user.name }}!", user={})
+
+
+def test_compiled_template_for():
+    source = "# List\n{% for item in items %}\n* {{ item }}\n{% endfor %}\nEnd"
+    assert render(source, items=["a", "b"]) == "# List\n* a\n* b\nEnd"
+    assert render(source, items=[]) == "# List\nEnd"
+
+    # Nested loops, with the same variable name
+    source = "{% for x in xs %}{% for x in x %}{{ x }}{% endfor %},{% endfor %}"
+    assert render(source, xs=[[1, 2], [3]]) == "12,3,"
+
+
+def test_compiled_template_for_batches():
+    class SmallBatchTemplate(CompiledTemplate):
+        LOOP_BATCH = 2
+
+    template = SmallBatchTemplate("{% for item in items %}* {{ item }}\n{% endfor %}")
+    chunks = list(template.render({"items": ["a", "b", "c"]}))
+    # Simple loops are rendered by batches of items
+    assert chunks == ["* a\n* b\n", "* c\n"]
+    assert list(template.render({"items": []})) == []
+
+
+def test_compiled_template_for_lookups():
+    source = "{% for item in items %}{{ item.name }} {{ title }}\n{% endfor %}"
+    # Attributes, mixed with dict items
+    items = [{"name": "a"}, date(2020, 12, 1)]
+    with pytest.raises(TemplateError):
+        render(source, items=items, title="Title")
+    source = "{% for item in items %}{{ item.year }} {{ title }}\n{% endfor %}"
+    items = [{"year": "a"}, date(2020, 12, 1)]
+    assert render(source, items=items, title="Title") == "a Title\n2020 Title\n"
+    # Missing keys raise a TemplateError
+    with pytest.raises(TemplateError):
+        render(source, items=[{}], title="Title")
+    with pytest.raises(TemplateError):
+        render(source, items=items)
+
+
+def test_compiled_template_if():
+    source = "{% if ok %}\nYes\n{% else %}\nNo\n{% endif %}\n"
+    assert render(source, ok=True) == "Yes\n"
+    assert render(source, ok=[]) == "No\n"
+    source = "{% if not ok %}Not OK{% endif %}"
+    assert render(source, ok=False) == "Not OK"
+    assert render(source, ok=True) == ""
+
+
+def test_compiled_template_include(tmpdir):
+    tmpdir.join("item.gmi").write_text("=> {{ item.url }} {{ title }}\n", "utf-8")
+    main = tmpdir.join("main.gmi")
+    main.write_text(
+        "{% for item in items %}\n{% include 'item.gmi' %}\n{% endfor %}", "utf-8"
+    )
+    registry = CompiledTemplateRegistry()
+    template = registry.get(main)
+    context = {"items": [{"url": "/a"}, {"url": "/b"}], "title": "Link"}
+    assert "".join(template.render(context)) == "=> /a Link\n=> /b Link\n"
+
+
+def test_compiled_template_syntax_errors():
+    for source in (
+        "{% for item in items %}",
+        "{% if ok %}{% endfor %}",
+        "{% endif %}",
+        "{% else %}",
+        "{% unknown %}",
+        "{{ 1 + 1 }}",
+        "{{ __import__('os') }}",
+    ):
+        with pytest.raises(TemplateError):
+            CompiledTemplate(source)